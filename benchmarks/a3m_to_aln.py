@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Runtime of the native a3m -> aln conversion (and of MAFFT --addfragments if
+`mafft` is on PATH) on synthetic HHblits-like alignments.
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import click
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.msa import a3m_to_aln
+
+AMINO = np.frombuffer(b"ACDEFGHIKLMNPQRSTVWY", dtype=np.uint8)
+
+
+def write_a3m(path, query, n_hits, rng):
+    """
+    Hits mutated from the query, with gapped columns and lowercase inserts.
+    """
+    L = len(query)
+    q = np.frombuffer(query.encode(), dtype=np.uint8)
+    with open(path, "w") as f:
+        f.write(">query\n%s\n" % query)
+        for k in range(n_hits):
+            row = np.where(rng.random(L) < 0.4, rng.choice(AMINO, L), q)
+            row[rng.random(L) < 0.1] = ord("-")
+            seq = []
+            for i, c in enumerate(row.tobytes().decode()):
+                seq.append(c)
+                if rng.random() < 0.02:
+                    seq.append(rng.choice(AMINO, rng.integers(1, 6)).tobytes().decode().lower())
+            f.write(">hit_%i\n%s\n" % (k, "".join(seq)))
+
+
+@click.command()
+@click.option("-L", "--length", default=300, type=int)
+@click.option("-n", "--n_hits", "n_hits_list", default=[500, 5000], multiple=True, type=int)
+def main(length, n_hits_list):
+    rng = np.random.default_rng(0)
+    query = rng.choice(AMINO, length).tobytes().decode()
+    methods = ["native"] + (["mafft"] if shutil.which("mafft") else [])
+    print("%8s %8s %10s" % ("hits", "method", "seconds"))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        query_fasta = os.path.join(tmp_dir, "query.fasta")
+        with open(query_fasta, "w") as f:
+            f.write(">query\n%s\n" % query)
+        for n_hits in n_hits_list:
+            a3m_file = os.path.join(tmp_dir, "hits_%i.a3m" % n_hits)
+            write_a3m(a3m_file, query, n_hits, rng)
+            for method in methods:
+                aln_file = os.path.join(tmp_dir, "hits_%i.%s.aln" % (n_hits, method))
+                t = time.time()
+                a3m_to_aln(tmp_dir, query_fasta, a3m_file, aln_file, method=method)
+                print("%8i %8s %10.3f" % (n_hits, method, time.time() - t))
+
+
+if __name__ == "__main__":
+    main()
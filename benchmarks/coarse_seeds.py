@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Minimizations per accepted decoy from coarse-folded seeds versus random
+basin starts. Needs PyRosetta and a feature file from run_inference.py.
+
+A decoy is accepted if its score is among the `n_structs` best of both
+modes together, i.e. it would survive in the repeat_minimize pool.
+"""
+import os
+import sys
+import time
+import click
+import numpy as np
+import pyrosetta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "folding"))
+from constraints import Constraints
+from score import geo_sf, score_it
+from coarse import coarse_seeds
+from minimizer import minimize_from_dihedrals, SEED_NOISE
+
+
+def _run(seq, constraint, sf, starts, noise):
+    scores, elapsed = [], []
+    for start in starts:
+        t = time.time()
+        pose = minimize_from_dihedrals(seq, constraint, sf, start, noise)
+        elapsed.append(time.time() - t)
+        scores.append(score_it(sf, pose))
+    return np.array(scores), np.array(elapsed)
+
+
+@click.command()
+@click.option("-i", "--fasta_path", required=True, type=click.Path(exists=True))
+@click.option("-f", "--feature_path", required=True, type=click.Path(exists=True))
+@click.option("-n", "--n_starts", default=20, type=int)
+@click.option("-ns", "--n_structs", default=20, type=int)
+@click.option("--n_seeds", default=5, type=int)
+def main(fasta_path, feature_path, n_starts, n_structs, n_seeds):
+    pyrosetta.init("-hb_cen_soft -out:level 100")
+    seq = open(fasta_path).readlines()[1].strip()
+    seq_no_g = "".join(["A" if _ == "G" else _ for _ in list(seq)])
+    constraint = Constraints(seq, feature_path).get_constraint_v1()
+    sf = geo_sf(dist_weight=5, dihedral_weight=1, angle_weight=1)
+
+    t = time.time()
+    seeds = coarse_seeds(np.load(feature_path)["cbcb"], n_seeds)
+    coarse_time = time.time() - t
+    results = {
+        "random": _run(seq_no_g, constraint, sf, [None] * n_starts, 60),
+        "coarse": _run(
+            seq_no_g, constraint, sf,
+            [seeds[i % n_seeds] for i in range(n_starts)], SEED_NOISE,
+        ),
+    }
+    threshold = np.sort(np.concatenate([x[0] for x in results.values()]))[
+        min(n_structs, 2 * n_starts) - 1
+    ]
+    print("L=%i, %i starts per mode, coarse folding %.1fs for %i seeds"
+          % (len(seq), n_starts, coarse_time, n_seeds))
+    print("%-8s %9s %9s %9s %12s %12s"
+          % ("mode", "best", "median", "accepted", "min/accept", "sec/accept"))
+    for mode, (scores, elapsed) in results.items():
+        accepted = int((scores <= threshold).sum())
+        total = elapsed.sum() + (coarse_time if mode == "coarse" else 0)
+        print("%-8s %9.2f %9.2f %9i %12s %12s" % (
+            mode, scores.min(), np.median(scores), accepted,
+            "%.2f" % (n_starts / accepted) if accepted else "-",
+            "%.1f" % (total / accepted) if accepted else "-",
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Minimization time and decoy quality with budgeted constraint sets versus
+the full set. Needs PyRosetta and a feature file from run_inference.py.
+
+Every budget minimizes from the same random starts; the decoys are scored
+against the full constraint set so the scores are comparable.
+"""
+import os
+import sys
+import time
+import click
+import numpy as np
+import pyrosetta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "folding"))
+from constraints import Constraints
+from score import geo_sf, score_it
+from minimizer import minimize_from_dihedrals
+
+
+@click.command()
+@click.option("-i", "--fasta_path", required=True, type=click.Path(exists=True))
+@click.option("-f", "--feature_path", required=True, type=click.Path(exists=True))
+@click.option("-n", "--n_starts", default=10, type=int)
+@click.option("-b", "--budgets", default=[1.0, 2.0, 4.0, 8.0], multiple=True, type=float)
+def main(fasta_path, feature_path, n_starts, budgets):
+    pyrosetta.init("-hb_cen_soft -out:level 100")
+    seq = open(fasta_path).readlines()[1].strip()
+    seq_no_g = "".join(["A" if _ == "G" else _ for _ in list(seq)])
+    sf = geo_sf(dist_weight=5, dihedral_weight=1, angle_weight=1)
+    raw_constraints = Constraints(seq, feature_path)
+    full = raw_constraints.get_constraint_v1()
+    rows = []
+    for budget in [None] + list(budgets):
+        constraint = raw_constraints.get_constraint_v1(budget)
+        with open(os.path.join(raw_constraints._tmp_dir.name, "minimize.cst")) as f:
+            n_constraints = sum(1 for _ in f)
+        elapsed, scores = [], []
+        for k in range(n_starts):
+            np.random.seed(k)
+            t = time.time()
+            pose = minimize_from_dihedrals(seq_no_g, constraint, sf)
+            elapsed.append(time.time() - t)
+            pose.remove_constraints()
+            full.apply(pose)
+            scores.append(score_it(sf, pose))
+        rows.append((budget, n_constraints, np.mean(elapsed), min(scores), np.median(scores)))
+    print("%8s %12s %10s %10s %10s" % ("budget", "constraints", "sec/min", "best", "median"))
+    for budget, n, sec, best, median in rows:
+        print("%8s %12i %10.2f %10.2f %10.2f"
+              % ("full" if budget is None else "%g/res" % budget, n, sec, best, median))
+
+
+if __name__ == "__main__":
+    main()
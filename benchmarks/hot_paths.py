@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Scaling of the hot paths with sequence length and worker count, on
+synthetic inputs and without PyRosetta, the TorchScript models or HHblits:
+
+  parse_feature / ensemble averaging (needs torch; skipped otherwise),
+  Constraints construction from the distograms alone and with the derived
+  maps of features.py, constraint filtering (get_constraint_v1),
+  repeat_minimize pool logic with the stand-in minimizer of standin.py.
+"""
+import os
+import sys
+import time
+import tempfile
+import click
+import numpy as np
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(bench_dir)
+sys.path.insert(0, bench_dir)
+import standin
+
+standin.install()
+sys.path.insert(0, os.path.join(root_dir, "folding"))
+sys.path.insert(0, os.path.join(root_dir, "distance_prediction"))
+from synthetic import synthetic_features, synthetic_sequence, write_aln
+from constraints import Constraints
+from features import derive
+from minimizer import repeat_minimize
+from score import geo_sf
+
+N_MODELS = 5
+
+
+def _time(fn, *args, **kwargs):
+    t = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - t, result
+
+
+def bench_inference(L, n_seqs, feat, tmp_dir, rng):
+    """
+    parse_feature on an alignment and the ensemble average of N_MODELS
+    stand-in models returning `feat`.
+    """
+    try:
+        import torch
+        import run_inference
+    except ImportError:
+        return None, None
+    aln = os.path.join(tmp_dir, "synthetic.aln")
+    write_aln(aln, synthetic_sequence(L, rng), n_seqs, rng)
+    parse_seconds, _ = _time(run_inference.parse_feature, aln)
+    outputs = tuple(torch.from_numpy(feat[k]) for k in ("cbcb", "omega", "theta", "phi"))
+    models = [lambda msa: outputs] * N_MODELS
+    predict_seconds, _ = _time(run_inference.predict, models, aln)
+    return parse_seconds, predict_seconds - parse_seconds
+
+
+def bench_constraints(seq, feat):
+    init_seconds, raw = _time(Constraints, seq, feat)
+    derived_seconds, _ = _time(Constraints, seq, dict(feat, **derive(feat)))
+    filter_seconds, _ = _time(raw.get_constraint_v1)
+    n_pairs = sum(len(x["p"]) for x in raw._raw_constraints.values())
+    return init_seconds, derived_seconds, filter_seconds, n_pairs
+
+
+def bench_pool(seq, constraint, n_workers, n_iter, n_structs, tmp_dir):
+    sf = geo_sf()
+    seconds, _ = _time(
+        repeat_minimize, seq, constraint, sf, tmp_dir, n_workers, n_structs, n_iter,
+        checkpoint_every=10,
+    )
+    ideal = standin.SETTINGS["cost_per_residue"] * len(seq) * n_iter / n_workers
+    return seconds, seconds / ideal
+
+
+def _fmt(x, pattern="%9.3f"):
+    return "%9s" % "-" if x is None else pattern % x
+
+
+@click.command()
+@click.option("-L", "--lengths", default=[100, 200, 500, 1000], multiple=True, type=int)
+@click.option("-w", "--workers", default=[1, 2, 4, 8], multiple=True, type=int)
+@click.option("--n_seqs", default=1000, type=int)
+@click.option("--n_iter", default=40, type=int)
+@click.option("--n_structs", default=20, type=int)
+@click.option("--cost_per_residue", default=1e-4, type=float)
+@click.option("--hold_gil", is_flag=True, default=False)
+@click.option("--seed", default=0, type=int)
+def main(lengths, workers, n_seqs, n_iter, n_structs, cost_per_residue, hold_gil, seed):
+    standin.SETTINGS.update(cost_per_residue=cost_per_residue, hold_gil=hold_gil)
+    rng = np.random.default_rng(seed)
+    np.random.seed(seed)
+    print("%6s %9s %9s %9s %9s %9s %9s" % (
+        "L", "parse", "ensemble", "cst_init", "cst_deriv", "cst_filter", "pairs"
+    ))
+    pool_rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for L in lengths:
+            feat = synthetic_features(L, rng)
+            seq = synthetic_sequence(L, rng)
+            parse, ensemble = bench_inference(L, n_seqs, feat, tmp_dir, rng)
+            # the builder sends stdout to the log; keep the table readable
+            with open(os.devnull, "w") as devnull:
+                stdout, sys.stdout = sys.stdout, devnull
+                try:
+                    init, derived, filt, n_pairs = bench_constraints(seq, feat)
+                    raw = Constraints(seq, feat)
+                    constraint = raw.get_constraint_v1()
+                    for n_workers in workers:
+                        seconds, overhead = bench_pool(
+                            seq, constraint, n_workers, n_iter, n_structs, tmp_dir
+                        )
+                        pool_rows.append((L, n_workers, seconds, overhead))
+                finally:
+                    sys.stdout = stdout
+            print("%6i %s %s %s %s %s %9i" % (
+                L, _fmt(parse), _fmt(ensemble), _fmt(init), _fmt(derived), _fmt(filt), n_pairs
+            ))
+    print()
+    print("repeat_minimize, %i minimizations, stand-in %.0e s/residue%s"
+          % (n_iter, cost_per_residue, ", GIL held" if hold_gil else ""))
+    print("%6s %8s %9s %12s" % ("L", "workers", "seconds", "vs ideal"))
+    for L, n_workers, seconds, overhead in pool_rows:
+        print("%6i %8i %9.3f %11.2fx" % (L, n_workers, seconds, overhead))
+
+
+if __name__ == "__main__":
+    main()
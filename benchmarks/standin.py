@@ -0,0 +1,139 @@
+"""
+A lightweight stand-in for the parts of PyRosetta used by folding/, so the
+pool, checkpoint and constraint code can be timed without Rosetta.
+
+install() registers it as `pyrosetta` in sys.modules; call it before
+importing any folding module. Minimization costs `cost_per_residue`
+seconds per residue, spent sleeping (releases the GIL, like native code
+that drops it) or spinning in Python (holds the GIL) with `hold_gil`.
+"""
+import sys
+import time
+import types
+import numpy as np
+
+SETTINGS = {"cost_per_residue": 1e-4, "hold_gil": False}
+
+
+class Pose:
+    def __init__(self, seq):
+        self.seq = seq
+        self.dihedrals = np.zeros((len(seq), 3))
+        self.dihedrals[:, 2] = 180.0
+
+    def total_residue(self):
+        return len(self.seq)
+
+    def phi(self, i):
+        return self.dihedrals[i - 1, 0]
+
+    def psi(self, i):
+        return self.dihedrals[i - 1, 1]
+
+    def omega(self, i):
+        return self.dihedrals[i - 1, 2]
+
+    def set_phi(self, i, x):
+        self.dihedrals[i - 1, 0] = x
+
+    def set_psi(self, i, x):
+        self.dihedrals[i - 1, 1] = x
+
+    def set_omega(self, i, x):
+        self.dihedrals[i - 1, 2] = x
+
+    def clone(self):
+        pose = Pose(self.seq)
+        pose.dihedrals = self.dihedrals.copy()
+        return pose
+
+
+class ScoreFunction:
+    def set_weight(self, term, weight):
+        pass
+
+    def __call__(self, pose):
+        return float(np.cos(np.deg2rad(pose.dihedrals[:, :2])).sum())
+
+
+class MoveMap:
+    def set_bb(self, x):
+        pass
+
+    def set_chi(self, x):
+        pass
+
+    def set_jump(self, x):
+        pass
+
+
+class MinMover:
+    def __init__(self, mmap, sf, *args):
+        pass
+
+    def max_iter(self, n):
+        pass
+
+    def apply(self, pose):
+        seconds = SETTINGS["cost_per_residue"] * pose.total_residue()
+        if SETTINGS["hold_gil"]:
+            end = time.perf_counter() + seconds
+            while time.perf_counter() < end:
+                pass
+        else:
+            time.sleep(seconds)
+        # move towards the score minimum at phi = psi = 180
+        pose.dihedrals[:, :2] += 0.5 * (180.0 - pose.dihedrals[:, :2])
+
+
+class ConstraintSetMover:
+    def constraint_file(self, path):
+        self.path = path
+
+    def add_constraints(self, x):
+        pass
+
+    def apply(self, pose):
+        pass
+
+
+def _unsupported(*args, **kwargs):
+    raise NotImplementedError("not available in the benchmark stand-in")
+
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+
+def install():
+    terms = types.SimpleNamespace(
+        atom_pair_constraint="atom_pair_constraint",
+        dihedral_constraint="dihedral_constraint",
+        angle_constraint="angle_constraint",
+    )
+    core = _module("pyrosetta.rosetta.core", scoring=terms)
+    core.id = _module("pyrosetta.rosetta.core.id", AtomID=_unsupported)
+    protocols = _module("pyrosetta.rosetta.protocols")
+    protocols.constraint_movers = _module(
+        "pyrosetta.rosetta.protocols.constraint_movers", ConstraintSetMover=ConstraintSetMover
+    )
+    protocols.minimization_packing = _module(
+        "pyrosetta.rosetta.protocols.minimization_packing", MinMover=MinMover
+    )
+    rosetta = _module(
+        "pyrosetta.rosetta", core=core, protocols=protocols,
+        numeric=_module("pyrosetta.rosetta.numeric", xyzVector_double_t=_unsupported),
+    )
+    _module(
+        "pyrosetta",
+        rosetta=rosetta,
+        init=lambda *args, **kwargs: None,
+        pose_from_sequence=lambda seq, residue_set="fa_standard": Pose(seq),
+        ScoreFunction=ScoreFunction,
+        MoveMap=MoveMap,
+        create_score_function=_unsupported,
+        SwitchResidueTypeSetMover=_unsupported,
+    )
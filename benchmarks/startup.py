@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Interpreter startup paid per target by run_ProFOLD.sh (one Python process
+per stage, each importing its libraries and calling pyrosetta.init) versus
+pipeline.profold.fold (everything imported and initialized once).
+"""
+import os
+import sys
+import time
+import subprocess
+import click
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from pipeline.profold import PYROSETTA_FLAGS
+
+INIT = "import pyrosetta; pyrosetta.init(%r)" % PYROSETTA_FLAGS
+# What each process started by run_ProFOLD.sh imports before doing work.
+STAGES = {
+    "first_seq": "from Bio import SeqIO",
+    "inference": "import torch, click, numpy; from Bio import SeqIO",
+    "builder": "import click, numpy; " + INIT,
+    "relax": "import click, numpy; " + INIT,
+}
+IN_PROCESS = "import torch, numpy; from Bio import SeqIO; " + INIT
+
+
+def _time(code, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.time()
+        subprocess.run([sys.executable, "-c", code], check=True, stdout=subprocess.DEVNULL)
+        best = min(best, time.time() - t)
+    return best
+
+
+@click.command()
+@click.option("-r", "--repeat", default=3, type=int)
+def main(repeat):
+    nested = 0.0
+    for stage, code in STAGES.items():
+        seconds = _time(code, repeat)
+        nested += seconds
+        print("%-10s %7.2fs" % (stage, seconds))
+    once = _time(IN_PROCESS, repeat)
+    print("%-10s %7.2fs" % ("nested", nested))
+    print("%-10s %7.2fs" % ("in-process", once))
+    print("saved per target: %.2fs" % (nested - once))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Synthetic inputs of any length: a compact CB trace, distograms derived from
+it in the layout of run_inference.py, and a FASTA alignment.
+"""
+import numpy as np
+
+AMINO = "ACDEFGHIKLMNPQRSTVWY"
+DIST_BINS = np.linspace(2.25, 19.75, 36)
+# Angle bins: omega/theta over (-180, 180], phi over [0, 180]
+N_BINS = {"omega": 24, "theta": 24, "phi": 12}
+
+
+def synthetic_trace(L, rng):
+    """
+    Random walk with 3.8A steps confined to a protein-sized sphere.
+    """
+    radius = 2.5 * L ** 0.38
+    x = np.zeros((L, 3))
+    for i in range(1, L):
+        for _ in range(100):
+            step = rng.normal(size=3)
+            p = x[i - 1] + 3.8 * step / np.linalg.norm(step)
+            if np.linalg.norm(p) < radius:
+                break
+        x[i] = p
+    return x
+
+
+def _distogram(dist, sharpness=1.5):
+    p = np.exp(-(dist[..., None] - DIST_BINS) ** 2 / (2 * sharpness ** 2))
+    far = np.exp(-np.maximum(20.5 - dist, 0)[..., None] ** 2 / (2 * sharpness ** 2))
+    # floor: network softmax outputs are never exactly zero
+    p = np.concatenate([p, far], axis=-1) + 1e-4
+    return p / p.sum(-1, keepdims=True)
+
+
+def _angle_map(contact, n_bins, rng, concentration=4.0):
+    """
+    Peaked distributions over `n_bins` angle bins carrying the contact
+    probability, plus the no-contact bin last.
+    """
+    L = len(contact)
+    bins = np.linspace(-np.pi, np.pi, n_bins, endpoint=False)
+    mu = rng.uniform(-np.pi, np.pi, (L, L, 1))
+    logits = concentration * np.cos(bins - mu)
+    p = np.exp(logits - logits.max(-1, keepdims=True))
+    p = contact[..., None] * (p + 1e-4) / (p + 1e-4).sum(-1, keepdims=True)
+    return np.concatenate([p, 1 - contact[..., None]], axis=-1)
+
+
+def synthetic_features(L, rng):
+    """
+    Feature arrays (cbcb, omega, theta, phi) as written by run_inference.py.
+    """
+    x = synthetic_trace(L, rng)
+    dist = np.linalg.norm(x[:, None] - x[None], axis=-1)
+    cbcb = _distogram(dist)
+    contact = cbcb[:, :, :-1].sum(-1)
+    feat = {"cbcb": cbcb}
+    for name, n_bins in N_BINS.items():
+        feat[name] = _angle_map(contact, n_bins, rng)
+    return {k: v.astype(np.float32) for k, v in feat.items()}
+
+
+def synthetic_sequence(L, rng):
+    return "".join(rng.choice(list(AMINO), L))
+
+
+def write_aln(path, seq, n_seqs, rng, mutation_rate=0.4, gap_rate=0.1):
+    """
+    A FASTA alignment of `seq` and `n_seqs` - 1 mutated, gapped copies.
+    """
+    q = np.frombuffer(seq.encode(), dtype=np.uint8)
+    amino = np.frombuffer(AMINO.encode(), dtype=np.uint8)
+    with open(path, "w") as f:
+        f.write(">query\n%s\n" % seq)
+        for k in range(1, n_seqs):
+            row = np.where(rng.random(len(q)) < mutation_rate, rng.choice(amino, len(q)), q)
+            row[rng.random(len(q)) < gap_rate] = ord("-")
+            f.write(">hit_%i\n%s\n" % (k, row.tobytes().decode()))
@@ -1,16 +1,87 @@
 #!/usr/bin/env python
 import os
+import sys
+import time
 import click
 import torch
 import numpy as np
 
 from Bio import SeqIO
 
-def load_models(model_dir):
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "folding"))
+from progress import Progress
+from resources import workers, query_length
+from features import PAIR_THRESHOLD, derive
+from validate import check_aln
+import metrics
+
+PRECISIONS = ["fp32", "bf16", "int8"]
+# Quantized models are cached here, by default in <model_dir>/int8 or, when
+# the model directory is read-only, in the user cache.
+INT8_CACHE_DIR = os.environ.get("PROFOLD_INT8_CACHE")
+# cbcb bins with centers below 8A (2.25, 2.75, ... 7.75), for contacts
+CONTACT_BINS = 12
+
+
+class _Autocast:
+    """
+    A model run under bfloat16 autocast, returning float32 outputs.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, *args):
+        with torch.autocast("cpu", dtype=torch.bfloat16):
+            outputs = self.model(*args)
+        return tuple(x.float() for x in outputs)
+
+
+def _quantize(path, cache_dir):
+    """
+    Dynamic int8 quantization of a TorchScript model (its linear layers),
+    cached in `cache_dir` and redone when the model file is newer.
+    """
+    cached = os.path.join(cache_dir, os.path.basename(path))
+    if os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(path):
+        return torch.jit.load(cached)
+    model = torch.jit.load(path).eval()
+    model = torch.quantization.quantize_dynamic_jit(
+        model, {"": torch.quantization.default_dynamic_qconfig}
+    )
+    os.makedirs(cache_dir, exist_ok=True)
+    torch.jit.save(model, cached + ".tmp")
+    os.replace(cached + ".tmp", cached)
+    return model
+
+
+def int8_cache_dir(model_dir):
+    """
+    The default cache of the quantized models of `model_dir`.
+    """
+    if INT8_CACHE_DIR:
+        return INT8_CACHE_DIR
+    if os.access(model_dir, os.W_OK):
+        return os.path.join(model_dir, "int8")
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "profold", "int8")
+
+
+def load_models(model_dir, precision="fp32", cache_dir=None):
+    """
+    The ensemble in `precision`: fp32, bf16 (autocast) or int8 (dynamic
+    quantization, cached in `cache_dir`, by default int8_cache_dir()).
+    """
     models = []
     for path in os.listdir(model_dir):
         if path.endswith(".pt"):
-            models.append(torch.jit.load(os.path.join(model_dir, path)))
+            path = os.path.join(model_dir, path)
+            if precision == "int8":
+                models.append(_quantize(path, cache_dir or int8_cache_dir(model_dir)))
+            elif precision == "bf16":
+                models.append(_Autocast(torch.jit.load(path)))
+            else:
+                models.append(torch.jit.load(path))
     return models
 
 
@@ -23,9 +94,14 @@ def parse_feature(aln_path):
     return msa
 
 
-def predict_single(models, aln_path, output_path):
+def predict(models, aln_path, pair_threshold=PAIR_THRESHOLD):
+    """
+    Ensemble-averaged cbcb, omega, theta and phi distograms of an aln file,
+    with their derived maps (see folding/features.py).
+    """
     feat = parse_feature(aln_path)
     cbcb, omega, theta, phi = [], [], [], []
+    tracker = Progress("inference", len(models))
     with torch.no_grad():
         for model in models:
             a, b, c, d = model(feat)
@@ -33,26 +109,128 @@ def predict_single(models, aln_path, output_path):
             omega.append(b.cpu().numpy())
             theta.append(c.cpu().numpy())
             phi.append(d.cpu().numpy())
-    np.savez(
-        output_path,
-        cbcb=np.mean(cbcb, axis=0),
-        omega=np.mean(omega, axis=0),
-        theta=np.mean(theta, axis=0),
-        phi=np.mean(phi, axis=0),
-    )
+            tracker.update()
+    feature = {
+        "cbcb": np.mean(cbcb, axis=0),
+        "omega": np.mean(omega, axis=0),
+        "theta": np.mean(theta, axis=0),
+        "phi": np.mean(phi, axis=0),
+    }
+    feature.update(derive(feature, pair_threshold))
+    return feature
+
+
+def save_feature(output_path, feature, precision):
+    """
+    Write a feature npz with the precision of the models that predicted it.
+    """
+    np.savez(output_path, precision=np.array(precision), **feature)
+
+
+def feature_precision(path):
+    """
+    The precision a feature npz was predicted in; files written before it
+    was stored are fp32.
+    """
+    with np.load(path) as feature:
+        return str(feature["precision"]) if "precision" in feature else "fp32"
+
+
+def load_feature(path):
+    """
+    The arrays of a feature npz, without its precision.
+    """
+    with np.load(path) as feature:
+        return {k: feature[k] for k in feature.files if k != "precision"}
+
+
+def predict_single(models, aln_path, output_path, pair_threshold=PAIR_THRESHOLD,
+                   precision="fp32"):
+    save_feature(output_path, predict(models, aln_path, pair_threshold), precision)
+
+
+def _top_contacts(cbcb, min_sep=6):
+    L = cbcb.shape[0]
+    prob = cbcb[:, :, :CONTACT_BINS].sum(-1)
+    i, j = np.triu_indices(L, min_sep)
+    order = np.argsort(-prob[i, j], kind="stable")[:L]
+    return set(zip(i[order], j[order]))
+
+
+def compare(reference, feature):
+    """
+    Mean KL divergence per pair of each distogram from its `reference`,
+    and the share of the reference top-L contacts (|i - j| >= 6) among
+    the top-L contacts of `feature`.
+    """
+    result = {}
+    for k in ("cbcb", "omega", "theta", "phi"):
+        p, q = reference[k] + 1e-8, feature[k] + 1e-8
+        result["kl_" + k] = float(np.mean(np.sum(p * np.log(p / q), axis=-1)))
+    L = reference["cbcb"].shape[0]
+    shared = _top_contacts(reference["cbcb"]) & _top_contacts(feature["cbcb"])
+    result["top_l_precision"] = len(shared) / L
+    return result
+
+
+def check_precision(model_dir, aln_path, precision, cache_dir=None):
+    """
+    Predict with the fp32 ensemble and in `precision`; returns the reduced
+    precision features and compare() of the two with the seconds of each.
+    """
+    models = load_models(model_dir)
+    t = time.perf_counter()
+    reference = predict(models, aln_path)
+    fp32_seconds = time.perf_counter() - t
+    models = load_models(model_dir, precision, cache_dir)
+    t = time.perf_counter()
+    feature = predict(models, aln_path)
+    seconds = time.perf_counter() - t
+    result = compare(reference, feature)
+    result.update(fp32_seconds=fp32_seconds, seconds=seconds, speedup=fp32_seconds / seconds)
+    return feature, result
 
 
 @click.command()
 @click.option("-m", "--model_dir", required=True, type=click.Path())
 @click.option("-i", "--aln_path", required=True, type=click.Path())
 @click.option("-o", "--output_path", required=True, type=click.Path())
-def main(model_dir, aln_path, output_path):
+@click.option("-t", "--n_threads", default="auto", type=str)
+@click.option("-p", "--precision", default="fp32", type=click.Choice(PRECISIONS))
+@click.option("--cache_dir", default=None, type=click.Path())
+@click.option("--check", is_flag=True, default=False)
+@click.option("--pair_threshold", default=PAIR_THRESHOLD, type=float)
+@click.option("--resume", is_flag=True, default=False)
+def main(model_dir, aln_path, output_path, n_threads, precision, cache_dir, check,
+         pair_threshold, resume):
     """
-    predict from a *.aln file
+    predict from a *.aln file; --n_threads 0 keeps the torch default.
+    --check also runs the fp32 ensemble and reports the accuracy and speed
+    of --precision against it. The candidate pairs stored with the
+    distograms are those with contact probability > --pair_threshold.
+    --resume keeps an existing output predicted in the same precision.
     """
-    models = load_models(model_dir)
-    predict_single(models, aln_path, output_path)
+    if resume and os.path.exists(output_path):
+        if feature_precision(output_path) == precision:
+            print("Reuse %s" % output_path)
+            return
+        print("Predict again: %s is not %s" % (output_path, precision))
+    # fail before loading the models
+    check_aln(aln_path)
+    n_threads = workers(n_threads, "inference", query_length(aln_path))
+    if n_threads > 0:
+        torch.set_num_threads(n_threads)
+    if check:
+        feature, result = check_precision(model_dir, aln_path, precision, cache_dir)
+        feature.update(derive(feature, pair_threshold))
+        for k, v in result.items():
+            print("%s %s: %.4f" % (precision, k, v))
+        save_feature(output_path, feature, precision)
+        return
+    models = load_models(model_dir, precision, cache_dir)
+    predict_single(models, aln_path, output_path, pair_threshold, precision)
 
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("inference"):
+        main()
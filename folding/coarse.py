@@ -0,0 +1,215 @@
+"""
+Coarse CB-trace folding from the predicted cbcb distogram, used to seed the
+Rosetta minimization with better starts than random basin dihedrals.
+
+distogram -> distances -> classical MDS -> stress refinement -> dihedrals
+"""
+import numpy as np
+
+# Same distance bins as Constraints._init_cbcb_constraints; the last
+# distogram bin holds the probability of no contact (> 20A).
+DIST_BINS = np.linspace(2.25, 19.75, 36)
+FAR = 20.0
+
+# Backbone basins of minimizer._random_dihedral.
+BASIN_PHI = np.array([-140, -72, -122, -82, -61, 57], dtype=np.float64)
+BASIN_PSI = np.array([153, 145, 117, -14, -41, 39], dtype=np.float64)
+
+# Ideal backbone geometry (A, degrees).
+_N_CA, _CA_C, _C_N, _CA_CB = 1.458, 1.525, 1.329, 1.53
+_N_CA_C, _CA_C_N, _C_N_CA, _N_CA_CB = 111.2, 116.2, 121.7, 110.5
+_C_N_CA_CB = -122.6
+
+
+def expected_distances(cbcb):
+    """
+    Returns (expected CB-CB distance, contact probability), both symmetric.
+    Pairs without contact are pulled towards FAR by their no-contact mass.
+    """
+    p = cbcb[:, :, :-1]
+    contact = p.sum(-1)
+    mean = (p * DIST_BINS).sum(-1) / np.maximum(contact, 1e-8)
+    dist = contact * mean + (1 - contact) * FAR
+    dist = (dist + dist.T) / 2
+    contact = (contact + contact.T) / 2
+    np.fill_diagonal(dist, 0)
+    return dist, contact
+
+
+def sample_distances(cbcb, rng):
+    """
+    Draw one distance matrix from the distogram, pair by pair.
+    """
+    p = cbcb / cbcb.sum(-1, keepdims=True)
+    cdf = np.cumsum(p, axis=-1)
+    u = rng.random(cbcb.shape[:2] + (1,))
+    k = np.minimum((cdf < u).sum(-1), len(DIST_BINS))
+    dist = np.append(DIST_BINS, FAR)[k]
+    dist = np.triu(dist, 1)
+    return dist + dist.T
+
+
+def shortest_paths(dist, contact, threshold=0.5):
+    """
+    Floyd-Warshall over confident contacts; an upper bound for the
+    distances the distogram says nothing about.
+    """
+    sp = np.where(contact > threshold, dist, np.inf)
+    np.fill_diagonal(sp, 0)
+    for k in range(len(sp)):
+        np.minimum(sp, sp[:, k, None] + sp[None, k, :], out=sp)
+    return sp
+
+
+def classical_mds(dist, dim=3):
+    n = len(dist)
+    center = np.eye(n) - 1.0 / n
+    gram = -0.5 * center @ (dist ** 2) @ center
+    w, v = np.linalg.eigh(gram)
+    idx = np.argsort(w)[::-1][:dim]
+    return v[:, idx] * np.sqrt(np.maximum(w[idx], 0))
+
+
+def refine(coords, dist, contact, upper, n_steps=300, lr=0.5, threshold=0.05):
+    """
+    Adam on the stress: harmonic on predicted contacts weighted by their
+    probability, flat-bottom between FAR and the `upper` bound for the
+    other pairs.
+    """
+    is_contact = contact > threshold
+    np.fill_diagonal(is_contact, False)
+    w = np.where(is_contact, contact, 0.05)
+    np.fill_diagonal(w, 0)
+    w = w / w.sum()
+    x = coords.copy()
+    m, v = np.zeros_like(x), np.zeros_like(x)
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    for step in range(1, n_steps + 1):
+        diff = x[:, None, :] - x[None, :, :]
+        r = np.sqrt((diff ** 2).sum(-1) + 1e-8)
+        err = np.where(is_contact, r - dist, np.minimum(r - FAR, 0) + np.maximum(r - upper, 0))
+        g = ((w * err / r)[:, :, None] * diff).sum(1) * 4
+        m = beta1 * m + (1 - beta1) * g
+        v = beta2 * v + (1 - beta2) * g ** 2
+        x -= lr * (m / (1 - beta1 ** step)) / (np.sqrt(v / (1 - beta2 ** step)) + eps)
+    return x
+
+
+def _place(a, b, c, bond, angle, torsion):
+    """
+    NeRF: the atom d with |cd| = bond, angle(b, c, d) = angle and
+    dihedral(a, b, c, d) = torsion (degrees).
+    """
+    angle, torsion = np.deg2rad(angle), np.deg2rad(torsion)
+    bc = (c - b) / np.linalg.norm(c - b)
+    n = np.cross(b - a, bc)
+    n /= np.linalg.norm(n)
+    m = np.cross(n, bc)
+    d = np.array(
+        [-bond * np.cos(angle), bond * np.sin(angle) * np.cos(torsion),
+         bond * np.sin(angle) * np.sin(torsion)]
+    )
+    return c + d[0] * bc + d[1] * m + d[2] * n
+
+
+def build_backbone(phi, psi, omega=None):
+    """
+    Ideal-geometry N, CA, C, CB coordinates, each (L, 3), from dihedrals.
+    """
+    L = len(phi)
+    omega = np.full(L, 180.0) if omega is None else omega
+    N = [np.zeros(3)]
+    CA = [np.array([_N_CA, 0, 0])]
+    a = np.deg2rad(_N_CA_C)
+    C = [CA[0] + _CA_C * np.array([-np.cos(a), np.sin(a), 0])]
+    for i in range(L - 1):
+        N.append(_place(N[i], CA[i], C[i], _C_N, _CA_C_N, psi[i]))
+        CA.append(_place(CA[i], C[i], N[i + 1], _N_CA, _C_N_CA, omega[i]))
+        C.append(_place(C[i], N[i + 1], CA[i + 1], _CA_C, _N_CA_C, phi[i + 1]))
+    CB = [_place(C[i], N[i], CA[i], _CA_CB, _N_CA_CB, _C_N_CA_CB) for i in range(L)]
+    return np.array(N), np.array(CA), np.array(C), np.array(CB)
+
+
+def trace_geometry(x):
+    """
+    Virtual bond angles theta[i] at x[i + 1] and virtual dihedrals tau[i]
+    of x[i..i + 3], in degrees.
+    """
+    b = x[1:] - x[:-1]
+    u = b / np.linalg.norm(b, axis=-1, keepdims=True)
+    theta = np.rad2deg(np.arccos(np.clip(-(u[:-1] * u[1:]).sum(-1), -1, 1)))
+    n1, n2 = np.cross(u[:-2], u[1:-1]), np.cross(u[1:-1], u[2:])
+    y = (np.cross(n1, n2) * u[1:-1]).sum(-1)
+    tau = np.rad2deg(np.arctan2(y, (n1 * n2).sum(-1)))
+    return theta, tau
+
+
+def _basin_geometry():
+    """
+    CB-trace (theta, tau) of an ideal homopolymer in each basin.
+    """
+    ref = []
+    for phi, psi in zip(BASIN_PHI, BASIN_PSI):
+        _, _, _, cb = build_backbone(np.full(8, phi), np.full(8, psi))
+        theta, tau = trace_geometry(cb)
+        ref.append((theta[3], tau[3]))
+    return np.array(ref)
+
+
+def trace_to_dihedrals(x):
+    """
+    Assign each residue the basin whose ideal CB-trace geometry is closest
+    to the local (theta, tau) of trace `x`. Returns (L, 3) phi/psi/omega.
+    """
+    L = len(x)
+    theta, tau = trace_geometry(x)
+    ref = _basin_geometry()
+    # tau[i] spans residues i..i+3: attribute it to residue i + 1
+    dtau = (tau[:, None] - ref[None, :, 1] + 180) % 360 - 180
+    dtheta = theta[:-1, None] - ref[None, :, 0]
+    cost = dtau ** 2 + dtheta ** 2
+    basin = np.argmin(cost, axis=-1)
+    basin = np.concatenate([basin[:1], basin, np.repeat(basin[-1:], 2)])[:L]
+    return np.stack([BASIN_PHI[basin], BASIN_PSI[basin], np.full(L, 180.0)], axis=-1)
+
+
+def _fix_chirality(x):
+    """
+    MDS cannot tell a structure from its mirror image; keep the one whose
+    helix-like virtual dihedrals are right-handed.
+    """
+    _, tau = trace_geometry(x)
+    local = tau[np.abs(tau) < 100]
+    if (local > 0).sum() < (local < 0).sum():
+        x = x * np.array([-1, 1, 1])
+    return x
+
+
+def coarse_fold(cbcb, n_steps=300, rng=None, sample=False):
+    """
+    CB trace (L, 3) from a cbcb distogram. With `sample`, distances are drawn
+    from the distogram instead of taking expectations, for diverse seeds.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    dist, contact = expected_distances(cbcb)
+    if sample:
+        dist = np.where(contact > 0.05, sample_distances(cbcb, rng), dist)
+    sp = shortest_paths(dist, contact)
+    upper = np.maximum(dist, np.where(np.isinf(sp), np.inf, sp))
+    full = np.where(contact > 0.5, dist, np.where(np.isinf(upper), FAR, upper))
+    x = classical_mds(full)
+    x = x + rng.normal(0, 0.1, x.shape)
+    x = refine(x, dist, contact, upper, n_steps=n_steps)
+    return _fix_chirality(x)
+
+
+def coarse_seeds(cbcb, n_seeds, n_steps=300, seed=None):
+    """
+    `n_seeds` (L, 3) phi/psi/omega arrays for repeat_minimize; the first one
+    from expected distances, the others from sampled ones.
+    """
+    rng = np.random.default_rng(seed)
+    return [
+        trace_to_dihedrals(coarse_fold(cbcb, n_steps=n_steps, rng=rng, sample=i > 0))
+        for i in range(n_seeds)
+    ]
@@ -1,14 +1,33 @@
+import os
 import tempfile
 import numpy as np
 import pyrosetta
+import metrics
+from features import PAIR_THRESHOLD, candidate_pairs
+
+# Sequence separation bands |i - j| sharing a constraint budget equally:
+# local, short, medium and long range.
+BANDS = ((1, 6), (6, 12), (12, 24), (24, None))
 
 
 class Constraints:
     def __init__(self, seq, feat_path, tmp_prefix="/dev/shm/"):
+        """
+        `feat_path` is a feature npz file, or its arrays already in memory
+        (a dict with cbcb, omega, theta and phi).
+
+        Candidate pairs are kept per feature type as arrays (i, j, contact
+        probability); spline potentials are only computed, and their files
+        written, for the constraints a get_constraint_* call selects.
+        """
         self._seq = seq
-        self._feat = np.load(feat_path)
+        if isinstance(feat_path, (str, os.PathLike)):
+            self._feat = np.load(feat_path)
+        else:
+            self._feat = feat_path
         self._tmp_dir = tempfile.TemporaryDirectory(prefix=tmp_prefix)
 
+        self._splines = {}
         self._raw_constraints = self._init_constraints()
 
     def _init_constraints(self):
@@ -19,107 +38,141 @@ class Constraints:
             "phi": self._init_phi_constraints(),
         }
 
+    def _pairs(self, kind, symmetric):
+        """
+        Table of the `kind` pairs with contact probability > 0.05: dict of
+        (n,) arrays i, j and p. Symmetric features keep j > i only. Uses
+        the derived maps of the feature file if it has them (features.py).
+        """
+        if kind + "_prob" in self._feat:
+            contact_prob = self._feat[kind + "_prob"]
+        else:
+            contact_prob = np.sum(self._feat[kind][:, :, :-1], axis=-1)
+        if kind + "_pairs" in self._feat and self._feat["pair_threshold"] <= PAIR_THRESHOLD:
+            idx, idy = self._feat[kind + "_pairs"].T
+            keep = contact_prob[idx, idy] > PAIR_THRESHOLD
+            idx, idy = idx[keep], idy[keep]
+        else:
+            idx, idy = candidate_pairs(contact_prob, PAIR_THRESHOLD, symmetric)
+        return {"i": idx, "j": idy, "p": contact_prob[idx, idy]}
+
     def _init_cbcb_constraints(self):
         cbcb = self._feat["cbcb"]
-        L = cbcb.shape[0]
         bins = np.linspace(2.25, 19.75, 36)
-        contact_prob = np.sum(cbcb[:, :, :-1], axis=-1)
-        ref = cbcb[:, :, -2:-1] * np.array((bins / bins[-1]) ** 1.57)[None, None]
-        potential = -np.log(cbcb[:, :, :-1] / ref)
-        bound_p = np.maximum(potential[:, :, :1], np.zeros((L, L, 1))) + 10
-        potential = np.concatenate([bound_p, potential], axis=-1)
-        bins = np.concatenate([[0], bins])
-        idx, idy = np.where(contact_prob > 0.05)
-        step = 0.5
-        ret = []
-        for i, j, p in zip(idx, idy, contact_prob[idx, idy]):
-            if j > i:
-                name = self._tmp_dir.name + "/%d.%d.txt" % (i + 1, j + 1)
-                with open(name, "w") as f:
-                    f.write("x_axis" + "\t%.3f" * len(bins) % tuple(bins) + "\n")
-                    f.write(
-                        "y_axis" + "\t%.3f" * len(bins) % tuple(potential[i, j]) + "\n"
-                    )
-                    line = "AtomPair %s %d %s %d SPLINE TAG %s 1.0 %.3f %.5f"
-                    line = line % ("CB", i + 1, "CB", j + 1, name, 1.0, step)
-                    ret.append([i, j, p, line])
-        return ret
+        ref_scale = np.array((bins / bins[-1]) ** 1.57)
+
+        def potential(i, j):
+            p = cbcb[i, j]
+            x = -np.log(p[:, :-1] / (p[:, -2:-1] * ref_scale))
+            return np.concatenate([np.maximum(x[:, :1], 0) + 10, x], axis=-1)
+
+        self._splines["cbcb"] = (np.concatenate([[0], bins]), potential, "%.3f")
+        return self._pairs("cbcb", symmetric=True)
 
     def _init_omega_constraints(self):
         omega = self._feat["omega"]
-        L = omega.shape[0]
         STEP = np.deg2rad(15)
         bins = np.linspace(-np.pi - 1.5 * STEP, np.pi + 1.5 * STEP, 24 + 4)
-        contact_prob = np.sum(omega[:, :, :-1], axis=-1)
-        omega = -np.log((omega[:, :, :-1] + 1e-4) / (omega[:, :, -2:-1] + 1e-4))
-        omega = np.concatenate([omega[:, :, -2:], omega, omega[:, :, :2]], axis=-1)
-        idx, idy = np.where(contact_prob > 0.05)
-        ret = []
-        for i, j, p in zip(idx, idy, contact_prob[idx, idy]):
-            if j > i:
-                name = self._tmp_dir.name + "/%d.%d_omega.txt" % (i + 1, j + 1)
-                with open(name, "w") as f:
-                    f.write("x_axis" + "\t%.5f" * len(bins) % tuple(bins) + "\n")
-                    f.write("y_axis" + "\t%.5f" * len(bins) % tuple(omega[i, j]) + "\n")
-                line = (
-                    "Dihedral CA %d CB %d CB %d CA %d SPLINE TAG %s 1.0 %.3f %.5f"
-                    % (i + 1, i + 1, j + 1, j + 1, name, 1.0, STEP)
-                )
-                ret.append([i, j, p, line])
-        return ret
+
+        def potential(i, j):
+            p = omega[i, j]
+            x = -np.log((p[:, :-1] + 1e-4) / (p[:, -2:-1] + 1e-4))
+            return np.concatenate([x[:, -2:], x, x[:, :2]], axis=-1)
+
+        self._splines["omega"] = (bins, potential, "%.5f")
+        return self._pairs("omega", symmetric=True)
 
     def _init_theta_constraints(self):
         theta = self._feat["theta"]
-        L = theta.shape[0]
         STEP = np.deg2rad(15)
         bins = np.linspace(-np.pi - 1.5 * STEP, np.pi + 1.5 * STEP, 24 + 4)
-        contact_prob = np.sum(theta[:, :, :-1], axis=-1)
-        theta = -np.log((theta[:, :, :-1] + 1e-4) / (theta[:, :, -2:-1] + 1e-4))
-        theta = np.concatenate([theta[:, :, -2:], theta, theta[:, :, :2]], axis=-1)
-        idx, idy = np.where(contact_prob > 0.05)
-        ret = []
-        for i, j, p in zip(idx, idy, contact_prob[idx, idy]):
-            if j != i:
-                name = self._tmp_dir.name + "/%d.%d_theta.txt" % (i + 1, j + 1)
-                with open(name, "w") as f:
-                    f.write("x_axis" + "\t%.5f" * len(bins) % tuple(bins) + "\n")
-                    f.write("y_axis" + "\t%.5f" * len(bins) % tuple(theta[i, j]) + "\n")
-                line = (
-                    "Dihedral N %d CA %d CB %d CB %d SPLINE TAG %s 1.0 %.3f %.5f "
-                    % (i + 1, i + 1, i + 1, j + 1, name, 1.0, STEP,)
-                )
-                ret.append([i, j, p, line])
-        return ret
+
+        def potential(i, j):
+            p = theta[i, j]
+            x = -np.log((p[:, :-1] + 1e-4) / (p[:, -2:-1] + 1e-4))
+            return np.concatenate([x[:, -2:], x, x[:, :2]], axis=-1)
+
+        self._splines["theta"] = (bins, potential, "%.5f")
+        return self._pairs("theta", symmetric=False)
 
     def _init_phi_constraints(self):
         phi = self._feat["phi"]
-        L = phi.shape[0]
         STEP = np.deg2rad(15)
         bins = np.linspace(-1.5 * STEP, np.pi + 1.5 * STEP, 12 + 4)
-        contact_prob = np.sum(phi[:, :, :-1], axis=-1)
-        phi = -np.log((phi[:, :, :-1] + 1e-4) / (phi[:, :, -2:-1] + 1e-4))
-        phi = np.concatenate(
-            [np.flip(phi[:, :, :2], axis=-1), phi, np.flip(phi[:, :, -2:], axis=-1)],
-            axis=-1,
+
+        def potential(i, j):
+            p = phi[i, j]
+            x = -np.log((p[:, :-1] + 1e-4) / (p[:, -2:-1] + 1e-4))
+            return np.concatenate(
+                [np.flip(x[:, :2], axis=-1), x, np.flip(x[:, -2:], axis=-1)], axis=-1
+            )
+
+        self._splines["phi"] = (bins, potential, "%.5f")
+        return self._pairs("phi", symmetric=False)
+
+    def _line(self, kind, i, j, y):
+        """
+        Write the spline `y` of pair (i, j) and return its constraint line.
+        """
+        bins, _, fmt = self._splines[kind]
+        suffix = "" if kind == "cbcb" else "_" + kind
+        name = self._tmp_dir.name + "/%d.%d%s.txt" % (i + 1, j + 1, suffix)
+        with open(name, "w") as f:
+            f.write("x_axis" + ("\t" + fmt) * len(bins) % tuple(bins) + "\n")
+            f.write("y_axis" + ("\t" + fmt) * len(bins) % tuple(y) + "\n")
+        if kind == "cbcb":
+            line = "AtomPair %s %d %s %d SPLINE TAG %s 1.0 %.3f %.5f"
+            return line % ("CB", i + 1, "CB", j + 1, name, 1.0, 0.5)
+        STEP = np.deg2rad(15)
+        if kind == "omega":
+            return (
+                "Dihedral CA %d CB %d CB %d CA %d SPLINE TAG %s 1.0 %.3f %.5f"
+                % (i + 1, i + 1, j + 1, j + 1, name, 1.0, STEP)
+            )
+        if kind == "theta":
+            return (
+                "Dihedral N %d CA %d CB %d CB %d SPLINE TAG %s 1.0 %.3f %.5f "
+                % (i + 1, i + 1, i + 1, j + 1, name, 1.0, STEP,)
+            )
+        return (
+            "Angle CA %d CB %d CB %d SPLINE TAG %s 1.0 %.3f %.5f         "
+            % (i + 1, i + 1, j + 1, name, 1.0, STEP,)
         )
-        idx, idy = np.where(contact_prob > 0.05)
-        ret = []
-        for i, j, p in zip(idx, idy, contact_prob[idx, idy]):
-            if j != i:
-                name = self._tmp_dir.name + "/%d.%d_phi.txt" % (i + 1, j + 1)
-                with open(name, "w") as f:
-                    f.write("x_axis" + "\t%.5f" * len(bins) % tuple(bins) + "\n")
-                    f.write("y_axis" + "\t%.5f" * len(bins) % tuple(phi[i, j]) + "\n")
-                line = (
-                    "Angle CA %d CB %d CB %d SPLINE TAG %s 1.0 %.3f %.5f         "
-                    % (i + 1, i + 1, j + 1, name, 1.0, STEP,)
-                )
-                ret.append([i, j, p, line])
-        return ret
+
+    def _select(self, kind, min_p=0.0, budget=None, fix_gly=False):
+        """
+        Indices into the `kind` table of the pairs with p > `min_p` (and no
+        glycine with `fix_gly`). With a `budget` of constraints per residue,
+        only the int(budget * L) most probable ones are kept, split equally
+        between the BANDS of sequence separation; the share a band cannot
+        use goes to the most probable remaining pairs.
+        """
+        table = self._raw_constraints[kind]
+        keep = table["p"] > min_p
+        if fix_gly:
+            gly = np.array([a == "G" for a in self._seq])
+            keep &= ~gly[table["i"]] & ~gly[table["j"]]
+        selected = np.flatnonzero(keep)
+        if budget is None:
+            return selected
+        n_total = int(budget * len(self._seq))
+        if len(selected) <= n_total:
+            return selected
+        order = selected[np.argsort(-table["p"][selected], kind="stable")]
+        sep = np.abs(table["i"][order] - table["j"][order])
+        share = n_total // len(BANDS)
+        chosen = np.zeros(len(order), dtype=bool)
+        for lo, hi in BANDS:
+            in_band = np.flatnonzero((sep >= lo) & ((sep < hi) if hi else True))
+            chosen[in_band[:share]] = True
+        rest = np.flatnonzero(~chosen)
+        chosen[rest[: n_total - chosen.sum()]] = True
+        return order[chosen]
 
     def _make_constraint(self, a):
         np.random.shuffle(a)
         tmpname = self._tmp_dir.name + "/minimize.cst"
+        self.cst_file = tmpname
         with open(tmpname, "w") as f:
             for line in a:
                 f.write(line + "\n")
@@ -128,37 +181,26 @@ class Constraints:
         constraints.add_constraints(True)
         return constraints
 
-    def get_constraint_v1(self):
-        cbcb = [line for _, _, _, line in self._raw_constraints["cbcb"]]
-        omega = [line for i, j, p, line in self._raw_constraints["omega"] if p > 0.6]
-        theta = [line for i, j, p, line in self._raw_constraints["theta"] if p > 0.6]
-        phi = [line for i, j, p, line in self._raw_constraints["phi"] if p > 0.7]
-        for x, y in zip(["CBCB", "OMEGA", "THETA", "PHI"], [cbcb, omega, theta, phi]):
-            print("%s constraints: %i" % (x, len(y)))
-        return self._make_constraint(cbcb + omega + theta + phi)
-
-    def get_constraint_v1_fix_gly(self):
-        cbcb = [
-            line
-            for i, j, _, line in self._raw_constraints["cbcb"]
-            if self._seq[i] != "G" and self._seq[j] != "G"
-        ]
-
-        omega = [
-            line
-            for i, j, p, line in self._raw_constraints["omega"]
-            if self._seq[i] != "G" and self._seq[j] != "G" and p > 0.6
-        ]
-        theta = [
-            line
-            for i, j, p, line in self._raw_constraints["theta"]
-            if p > 0.6 and self._seq[i] != "G" and self._seq[j] != "G"
-        ]
-        phi = [
-            line
-            for i, j, p, line in self._raw_constraints["phi"]
-            if p > 0.7 and self._seq[i] != "G" and self._seq[j] != "G"
-        ]
-        for x, y in zip(["CBCB", "OMEGA", "THETA", "PHI"], [cbcb, omega, theta, phi]):
-            print("%s constraints: %i" % (x, len(y)))
-        return self._make_constraint(cbcb + omega + theta + phi)
+    def _get_constraint(self, thresholds, budget, fix_gly):
+        lines = []
+        for kind, min_p in thresholds:
+            table = self._raw_constraints[kind]
+            selected = self._select(kind, min_p, budget, fix_gly)
+            print("%s constraints: %i" % (kind.upper(), len(selected)))
+            metrics.count("constraints_" + kind, len(selected))
+            i, j = table["i"][selected], table["j"][selected]
+            potential = self._splines[kind][1](i, j)
+            lines += [self._line(kind, *args) for args in zip(i, j, potential)]
+        return self._make_constraint(lines)
+
+    def get_constraint_v1(self, budget=None):
+        """
+        ConstraintSetMover for the centroid stage. `budget` limits each
+        feature type to that many constraints per residue, by probability.
+        """
+        thresholds = [("cbcb", 0.0), ("omega", 0.6), ("theta", 0.6), ("phi", 0.7)]
+        return self._get_constraint(thresholds, budget, fix_gly=False)
+
+    def get_constraint_v1_fix_gly(self, budget=None):
+        thresholds = [("cbcb", 0.0), ("omega", 0.6), ("theta", 0.6), ("phi", 0.7)]
+        return self._get_constraint(thresholds, budget, fix_gly=True)
@@ -0,0 +1,164 @@
+import os
+import json
+import struct
+import numpy as np
+
+MAGIC = b"PROFOLD-DECOYS\x01\n"
+FOOTER_MAGIC = b"DCYINDEX"
+_PREFIX = struct.Struct("<II")
+_FOOTER = struct.Struct("<Q8s")
+
+
+def _scan(f):
+    """
+    Rebuild the index of a container without (or with a broken) footer by
+    skipping from record header to record header.
+    """
+    size = f.seek(0, 2)
+    end = f.seek(len(MAGIC))
+    headers = []
+    while end + _PREFIX.size <= size:
+        header_len, payload_len = _PREFIX.unpack(f.read(_PREFIX.size))
+        if header_len == 0:
+            break  # index footer
+        offset = end + _PREFIX.size + header_len
+        if offset + payload_len > size:
+            break  # record cut short by an interrupted writer
+        header = json.loads(f.read(header_len))
+        header["offset"] = offset
+        header["payload_len"] = payload_len
+        headers.append(header)
+        end = f.seek(offset + payload_len)
+    return headers, end
+
+
+def _read_index(f):
+    """
+    Returns (headers, end of the records), from the footer if there is one.
+    """
+    size = f.seek(0, 2)
+    if size >= len(MAGIC) + _PREFIX.size + _FOOTER.size:
+        f.seek(size - _FOOTER.size)
+        index_offset, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+        if magic == FOOTER_MAGIC and index_offset < size:
+            f.seek(index_offset)
+            header_len, index_len = _PREFIX.unpack(f.read(_PREFIX.size))
+            if header_len == 0:
+                return json.loads(f.read(index_len)), index_offset
+    return _scan(f)
+
+
+def read_record(path, header):
+    """
+    Returns (atoms_per_res, coords) of the record described by `header`
+    (an entry of DecoyReader.headers), reading only its payload.
+    """
+    with open(path, "rb") as f:
+        f.seek(header["offset"])
+        payload = f.read(header["payload_len"])
+    n_res = len(header["seq"])
+    atoms_per_res = np.frombuffer(payload[:n_res], dtype=np.uint8)
+    coords = np.frombuffer(payload[n_res:], dtype=np.float32).reshape(-1, 3)
+    return atoms_per_res, coords
+
+
+class DecoyWriter:
+    """
+    Append decoys to a single binary container instead of one PDB per decoy.
+
+    Each record is a small JSON header (tag, score, sequence, residue type
+    set, Rosetta annotated sequence naming every residue type, atom count)
+    followed by the number of atoms of each residue as uint8 and all atom
+    coordinates as a float32 (n_atoms, 3) array. Closing the writer appends
+    an index of all records so readers do not have to scan the file.
+    """
+
+    def __init__(self, path, append=False):
+        self.headers = []
+        if append and os.path.exists(path):
+            self._f = open(path, "r+b")
+            self.headers, end = _read_index(self._f)
+            self._f.seek(end)
+            self._f.truncate()
+        else:
+            self._f = open(path, "wb")
+            self._f.write(MAGIC)
+        self._tags = {h["tag"] for h in self.headers}
+
+    def write(self, tag, score, seq, residue_set, annotated_seq, atoms_per_res, coords):
+        if tag in self._tags:
+            raise ValueError("Duplicate decoy tag %s" % tag)
+        atoms_per_res = np.asarray(atoms_per_res, dtype=np.uint8)
+        coords = np.asarray(coords, dtype=np.float32).reshape(-1, 3)
+        header = {
+            "tag": tag,
+            "score": float(score),
+            "seq": seq,
+            "residue_set": residue_set,
+            "annotated_seq": annotated_seq,
+            "n_atoms": len(coords),
+        }
+        raw_header = json.dumps(header).encode()
+        payload = atoms_per_res.tobytes() + coords.tobytes()
+        self._f.write(_PREFIX.pack(len(raw_header), len(payload)))
+        self._f.write(raw_header)
+        header["offset"] = self._f.tell()
+        header["payload_len"] = len(payload)
+        self._f.write(payload)
+        self._f.flush()
+        self.headers.append(header)
+        self._tags.add(tag)
+
+    def close(self):
+        index = json.dumps(self.headers).encode()
+        index_offset = self._f.tell()
+        self._f.write(_PREFIX.pack(0, len(index)))
+        self._f.write(index)
+        self._f.write(_FOOTER.pack(index_offset, FOOTER_MAGIC))
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class DecoyReader:
+    """
+    Random access to a decoy container by tag, using its index footer (or
+    a scan of the record headers if the writer did not finish).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, "rb")
+        if self._f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a decoy container" % path)
+        self.headers, _ = _read_index(self._f)
+        self.index = {h["tag"]: i for i, h in enumerate(self.headers)}
+
+    def __len__(self):
+        return len(self.headers)
+
+    def tags(self):
+        return [h["tag"] for h in self.headers]
+
+    def scores(self):
+        return [(h["tag"], h["score"]) for h in self.headers]
+
+    def read(self, tag):
+        """
+        Returns (header, atoms_per_res, coords) of the decoy `tag`.
+        """
+        header = self.headers[self.index[tag]]
+        return (header,) + read_record(self.path, header)
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
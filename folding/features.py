@@ -0,0 +1,44 @@
+"""
+Derived maps stored next to the distograms in the feature npz, so that the
+consumers do not reduce the L x L x bins tensors again:
+
+  <kind>_prob      contact probability (every bin but the last), float32
+  <kind>_argmax    most probable bin, uint8
+  <kind>_pairs     (n, 2) int32 candidate pairs (i, j) with <kind>_prob
+                   above pair_threshold; j > i only for symmetric kinds
+  cbcb_expected    expected CB-CB distance (coarse.expected_distances)
+  pair_threshold   the threshold of the pair lists
+
+for every kind of KINDS. Feature files without them still work.
+"""
+import numpy as np
+from coarse import expected_distances
+
+KINDS = ("cbcb", "omega", "theta", "phi")
+SYMMETRIC = ("cbcb", "omega")
+PAIR_THRESHOLD = 0.05
+
+
+def candidate_pairs(contact_prob, threshold, symmetric):
+    """
+    (i, j) arrays of the pairs with contact probability above `threshold`.
+    """
+    idx, idy = np.where(contact_prob > threshold)
+    keep = idy > idx if symmetric else idy != idx
+    return idx[keep], idy[keep]
+
+
+def derive(feature, pair_threshold=PAIR_THRESHOLD):
+    """
+    The derived maps of a feature dict with cbcb, omega, theta and phi.
+    """
+    derived = {}
+    for kind in KINDS:
+        prob = np.sum(feature[kind][:, :, :-1], axis=-1)
+        idx, idy = candidate_pairs(prob, pair_threshold, kind in SYMMETRIC)
+        derived[kind + "_prob"] = prob.astype(np.float32)
+        derived[kind + "_argmax"] = np.argmax(feature[kind], axis=-1).astype(np.uint8)
+        derived[kind + "_pairs"] = np.stack([idx, idy], axis=1).astype(np.int32)
+    derived["cbcb_expected"] = expected_distances(feature["cbcb"])[0].astype(np.float32)
+    derived["pair_threshold"] = np.array(pair_threshold)
+    return derived
@@ -0,0 +1,223 @@
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import threading
+import subprocess
+
+PENDING = "pending"
+CLAIMED = "claimed"
+RESULTS = "results"
+TMP = "tmp"
+STOP = "stop"
+STOP_ALL = "STOP"
+
+
+class TaskQueue:
+    """
+    A broker-less task queue living in a (shared) directory.
+
+    Tasks are JSON files moved between sub-directories with `os.rename`,
+    which is atomic on POSIX file systems (including NFS), so exactly one
+    worker wins the claim of a task:
+
+        pending/<run>.<id>.json --claim--> claimed/<run>.<id>.json
+                                --complete--> results/<run>/<id>.json
+
+    Every coordinator publishes under its own `run` token and only reads the
+    results of its run, so several runs can share one directory. A claimed
+    task whose file has not been touched for `lease` seconds is considered
+    lost (its worker died) and is moved back to pending.
+    """
+
+    def __init__(self, root, run=None):
+        self.root = os.path.abspath(root)
+        self.run = run or uuid.uuid4().hex[:12]
+        for name in (PENDING, CLAIMED, RESULTS, TMP, STOP):
+            os.makedirs(os.path.join(self.root, name), exist_ok=True)
+
+    def _path(self, state, name):
+        return os.path.join(self.root, state, name + ".json")
+
+    def _result_path(self, run, task_id):
+        return os.path.join(self.root, RESULTS, run, task_id + ".json")
+
+    def _write(self, path, obj):
+        tmp_path = os.path.join(self.root, TMP, uuid.uuid4().hex)
+        with open(tmp_path, "w") as f:
+            json.dump(obj, f)
+        os.replace(tmp_path, path)
+
+    def publish(self, task_id, task):
+        self._write(self._path(PENDING, "%s.%s" % (self.run, task_id)), task)
+
+    def claim(self, run=None):
+        """
+        Claim one pending task, of `run` only if given.
+        Returns (name, task) or None; `name` is "<run>.<task id>".
+        """
+        for entry in sorted(os.listdir(os.path.join(self.root, PENDING))):
+            name = entry[: -len(".json")]
+            if run and not name.startswith(run + "."):
+                continue
+            pending = self._path(PENDING, name)
+            claimed = self._path(CLAIMED, name)
+            try:
+                # Touch first: the lease counts from the claim, not the publish.
+                os.utime(pending)
+                os.rename(pending, claimed)
+            except FileNotFoundError:
+                continue  # claimed by another worker
+            with open(claimed) as f:
+                return name, json.load(f)
+        return None
+
+    def heartbeat(self, name):
+        try:
+            os.utime(self._path(CLAIMED, name))
+        except FileNotFoundError:
+            pass
+
+    def complete(self, name, result):
+        run, task_id = name.split(".", 1)
+        os.makedirs(os.path.join(self.root, RESULTS, run), exist_ok=True)
+        self._write(self._result_path(run, task_id), result)
+        try:
+            os.remove(self._path(CLAIMED, name))
+        except FileNotFoundError:
+            pass
+
+    def requeue_expired(self, lease):
+        now = time.time()
+        for entry in os.listdir(os.path.join(self.root, CLAIMED)):
+            name = entry[: -len(".json")]
+            if not name.startswith(self.run + "."):
+                continue
+            path = self._path(CLAIMED, name)
+            try:
+                if now - os.path.getmtime(path) > lease:
+                    os.rename(path, self._path(PENDING, name))
+                    print("Requeue expired task %s" % name)
+            except FileNotFoundError:
+                continue
+
+    def collect(self):
+        """
+        Yield (task_id, result) for finished tasks of this run, removing
+        their result files.
+        """
+        results_dir = os.path.join(self.root, RESULTS, self.run)
+        if not os.path.isdir(results_dir):
+            return
+        for entry in sorted(os.listdir(results_dir)):
+            task_id = entry[: -len(".json")]
+            path = self._result_path(self.run, task_id)
+            try:
+                with open(path) as f:
+                    result = json.load(f)
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            yield task_id, result
+
+    def drain(self, task_ids, lease, poll=1.0):
+        """
+        Yield (task_id, result) until every task in `task_ids` has finished.
+        Duplicate results of requeued tasks are dropped.
+        """
+        waiting = set(task_ids)
+        while waiting:
+            for task_id, result in self.collect():
+                if task_id in waiting:
+                    waiting.discard(task_id)
+                    yield task_id, result
+            if waiting:
+                self.requeue_expired(lease)
+                time.sleep(poll)
+
+    def stop(self):
+        """
+        Withdraw the tasks of this run nobody claimed yet and tell the workers
+        bound to it (run_worker.py --run) to exit.
+        """
+        for entry in os.listdir(os.path.join(self.root, PENDING)):
+            if entry.startswith(self.run + "."):
+                try:
+                    os.remove(os.path.join(self.root, PENDING, entry))
+                except FileNotFoundError:
+                    pass
+        with open(os.path.join(self.root, STOP, self.run), "w") as f:
+            f.write(socket.gethostname() + "\n")
+
+    def stopped(self, run=None, since=0.0):
+        """
+        True if `run` was stopped, or if the whole queue was stopped (a STOP
+        file in its root) after `since`; older STOP files are ignored.
+        """
+        if run and os.path.exists(os.path.join(self.root, STOP, run)):
+            return True
+        try:
+            return os.path.getmtime(os.path.join(self.root, STOP_ALL)) > since
+        except FileNotFoundError:
+            return False
+
+
+def _heartbeat(task_queue, name, interval, done):
+    while not done.wait(interval):
+        task_queue.heartbeat(name)
+
+
+def serve(task_queue, handler, lease, poll=2.0, idle_timeout=0, run=None):
+    """
+    Worker loop: claim tasks (of `run` only if given), run `handler(task)`
+    and publish its result until the queue is stopped or stays empty for
+    `idle_timeout` seconds. Errors are returned as {"error": ...} results.
+    """
+    worker = "%s:%d" % (socket.gethostname(), os.getpid())
+    started = idle_since = time.time()
+    while not task_queue.stopped(run, started):
+        claimed = task_queue.claim(run)
+        if claimed is None:
+            if idle_timeout and time.time() - idle_since > idle_timeout:
+                break
+            time.sleep(poll)
+            continue
+        name, task = claimed
+        print("%s start %s" % (worker, name))
+        done = threading.Event()
+        beat = threading.Thread(target=_heartbeat, args=(task_queue, name, lease / 3, done))
+        beat.start()
+        t = time.time()
+        try:
+            result = handler(task)
+        except Exception as e:
+            result = {"error": "%s: %s" % (worker, e)}
+        result["seconds"] = time.time() - t
+        done.set()
+        beat.join()
+        task_queue.complete(name, result)
+        idle_since = time.time()
+
+
+def spawn_workers(queue_dir, n_workers, lease, run):
+    """
+    Launch `n_workers` local run_worker.py processes bound to `run`.
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run_worker.py")
+    return [
+        subprocess.Popen(
+            [sys.executable, script, "-q", queue_dir, "--lease", str(lease), "--run", run]
+        )
+        for _ in range(n_workers)
+    ]
+
+
+def stop_workers(task_queue, procs):
+    """
+    Stop the run: its bound workers exit after their current task.
+    """
+    task_queue.stop()
+    for proc in procs:
+        proc.wait()
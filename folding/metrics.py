@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+"""
+Opt-in per-stage metrics and profiling.
+
+PROFOLD_METRICS=<dir> makes every stage write <dir>/<stage>.json with its
+wall time, CPU time (including child processes), peak RSS and counters
+(constraints per type, minimizations, score evaluations, lock waits, relax
+time per decoy, ...), those of pool workers included (take() and add()).
+PROFOLD_PROFILE=<stage> also dumps a cProfile of that stage, all threads
+included, to <dir>/<stage>.prof (or the working directory without
+PROFOLD_METRICS).
+
+    python folding/metrics.py <dir> <metrics.json>
+
+merges the stage files into one.
+"""
+import os
+import json
+import time
+import pstats
+import cProfile
+import resource
+import threading
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_stage = {}
+
+
+def enabled():
+    return bool(os.environ.get("PROFOLD_METRICS"))
+
+
+def _cpu_seconds():
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (self_usage.ru_utime + self_usage.ru_stime
+            + children.ru_utime + children.ru_stime)
+
+
+def start(name):
+    with _lock:
+        _stage.clear()
+        _stage.update(
+            name=name, wall=time.time(), cpu=_cpu_seconds(),
+            counts={}, times={}, values={}, profiles=[],
+        )
+
+
+def take():
+    """
+    The counters, times and values recorded by this process since the last
+    take(), which forgets them. Pool workers return them with their result
+    for the parent to add() to its stage: a forked worker only has a copy
+    of the parent's stage. A worker without one starts collecting.
+    """
+    with _lock:
+        taken = {k: _stage.get(k, {}) for k in ("counts", "times", "values")}
+        if _stage:
+            _stage.update(counts={}, times={}, values={})
+        elif enabled():
+            _stage.update(
+                name="worker", wall=time.time(), cpu=_cpu_seconds(),
+                counts={}, times={}, values={}, profiles=[],
+            )
+    return taken
+
+
+def add(taken):
+    """
+    Add what a worker take()s to the current stage.
+    """
+    with _lock:
+        if not _stage:
+            return
+        for name, n in taken["counts"].items():
+            _stage["counts"][name] = _stage["counts"].get(name, 0) + n
+        for name, seconds in taken["times"].items():
+            _stage["times"][name] = _stage["times"].get(name, 0.0) + seconds
+        for name, values in taken["values"].items():
+            _stage["values"].setdefault(name, []).extend(values)
+
+
+def clear(metrics_dir):
+    """
+    Remove the stage files of a previous run from `metrics_dir`, so that
+    merge() does not report stages this run skipped.
+    """
+    if not os.path.isdir(metrics_dir):
+        return
+    for entry in os.listdir(metrics_dir):
+        if entry.endswith((".json", ".prof")):
+            os.remove(os.path.join(metrics_dir, entry))
+
+
+def count(name, n=1):
+    with _lock:
+        if _stage:
+            _stage["counts"][name] = _stage["counts"].get(name, 0) + n
+
+
+def add_time(name, seconds):
+    with _lock:
+        if _stage:
+            _stage["times"][name] = _stage["times"].get(name, 0.0) + seconds
+
+
+def record(name, value):
+    with _lock:
+        if _stage:
+            _stage["values"].setdefault(name, []).append(value)
+
+
+@contextmanager
+def timed(name):
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(name, time.perf_counter() - t)
+
+
+@contextmanager
+def profiled():
+    """
+    Profile the calling thread if the current stage is PROFOLD_PROFILE;
+    use it in the main thread and in every worker thread of the stage.
+    """
+    if not _stage or os.environ.get("PROFOLD_PROFILE") != _stage["name"]:
+        yield
+        return
+    profile = cProfile.Profile()
+    with _lock:
+        _stage["profiles"].append(profile)
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+
+
+def finish():
+    """
+    Write the metrics (and profile) of the current stage if enabled.
+    """
+    with _lock:
+        stage, profiles = dict(_stage), _stage.get("profiles", [])
+        _stage.clear()
+    if not stage:
+        return
+    out_dir = os.environ.get("PROFOLD_METRICS") or "."
+    if profiles:
+        path = os.path.join(out_dir, stage["name"] + ".prof")
+        os.makedirs(out_dir, exist_ok=True)
+        pstats.Stats(*profiles).dump_stats(path)
+        print("Profile of %s written to %s" % (stage["name"], path))
+    if not enabled():
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    result = {
+        "stage": stage["name"],
+        "wall_seconds": time.time() - stage["wall"],
+        "cpu_seconds": _cpu_seconds() - stage["cpu"],
+        # ru_maxrss is in KiB on Linux; the peak of this process so far
+        "peak_rss_mb": usage.ru_maxrss / 1024,
+        "children_peak_rss_mb": children.ru_maxrss / 1024,
+        "counts": stage["counts"],
+        "seconds": stage["times"],
+    }
+    for name, values in stage["values"].items():
+        result[name] = {
+            "n": len(values), "mean": sum(values) / len(values),
+            "min": min(values), "max": max(values),
+        }
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, stage["name"] + ".json"), "w") as f:
+        json.dump(result, f, indent=2)
+
+
+@contextmanager
+def stage(name):
+    start(name)
+    try:
+        with profiled():
+            yield
+    finally:
+        finish()
+
+
+def merge(metrics_dir, output_path):
+    """
+    Combine the <stage>.json files of `metrics_dir` into `output_path`.
+    """
+    stages = {}
+    for entry in sorted(os.listdir(metrics_dir)):
+        if entry.endswith(".json"):
+            with open(os.path.join(metrics_dir, entry)) as f:
+                result = json.load(f)
+            stages[result["stage"]] = result
+    with open(output_path, "w") as f:
+        json.dump(stages, f, indent=2)
+    return output_path
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        print("Usage: %s <metrics_dir> <metrics.json>" % sys.argv[0])
+        sys.exit(1)
+    merge(sys.argv[1], sys.argv[2])
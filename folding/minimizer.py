@@ -1,4 +1,5 @@
 import os
+import time
 import threading
 import queue
 import numpy as np
@@ -9,8 +10,12 @@ from pyrosetta import (
     create_score_function,
     SwitchResidueTypeSetMover,
 )
+from pyrosetta.rosetta.core.id import AtomID
+from pyrosetta.rosetta.numeric import xyzVector_double_t
 from pyrosetta.rosetta.protocols.minimization_packing import MinMover
 from score import score_it
+from progress import Progress
+import metrics
 
 
 def _random_dihedral():
@@ -36,14 +41,39 @@ def _random_pose(seq, constraint):
     return pose
 
 
-def _add_noise(pose):
+def _pose_from_dihedrals(seq, dihedrals, constraint):
+    pose = pose_from_sequence(seq, "centroid")
+    for i, (phi, psi, omega) in enumerate(dihedrals, 1):
+        pose.set_phi(i, phi)
+        pose.set_psi(i, psi)
+        pose.set_omega(i, omega)
+    constraint.apply(pose)
+    return pose
+
+
+def _add_noise(pose, sigma=60):
     for i in range(1, pose.total_residue()):
-        phi = pose.phi(i) + np.random.normal(0, 60)
-        psi = pose.psi(i) + np.random.normal(0, 60)
+        phi = pose.phi(i) + np.random.normal(0, sigma)
+        psi = pose.psi(i) + np.random.normal(0, sigma)
         pose.set_phi(i, phi)
         pose.set_psi(i, psi)
 
 
+# Coarse seeds (see coarse.py) are only perturbed, not scrambled like pool members.
+SEED_NOISE = 15
+
+
+def _start_pose(seq, constraint, seeds, idx):
+    """
+    A fresh start: the coarse seed of iteration `idx` if any, else random.
+    """
+    if not seeds:
+        return _random_pose(seq, constraint)
+    pose = _pose_from_dihedrals(seq, seeds[idx % len(seeds)], constraint)
+    _add_noise(pose, SEED_NOISE)
+    return pose
+
+
 def _minimize_step(sf, pose):
     mmap = MoveMap()
     mmap.set_bb(True)
@@ -52,53 +82,265 @@ def _minimize_step(sf, pose):
 
     min_mover = MinMover(mmap, sf, "lbfgs_armijo_nonmonotone", 0.0001, True)
     min_mover.max_iter(1000)
-    min_mover.apply(pose)
+    with metrics.timed("minimize"):
+        min_mover.apply(pose)
+    metrics.count("minimizations")
 
 
-def _worker(seq, constraint, sf, run_dir, pose_pool, pool_size, task_queue, mutex):
-    while True:
-        try:
-            idx = task_queue.get(block=False)
-            print("Start minimize %i ................." % idx)
-            mutex.acquire()
-            if len(pose_pool) < pool_size or np.random.random() < 0.1:
-                pose = _random_pose(seq, constraint)
-            else:
-                p = np.random.randint(len(pose_pool))
-                pose = pose_pool[p].clone()
-                _add_noise(pose)
-            mutex.release()
-            _minimize_step(sf, pose)
-            mutex.acquire()
-            pose_pool.append(pose)
-            if len(pose_pool) > pool_size:
-                pose_pool.sort(key=lambda x: score_it(sf, x))
-                del pose_pool[-1]
-            print("Score %i: %f" % (idx, score_it(sf, pose)))
-            mutex.release()
+def pose_dihedrals(pose):
+    return [[pose.phi(i), pose.psi(i), pose.omega(i)] for i in range(1, pose.total_residue() + 1)]
+
+
+def pose_coords(pose):
+    """
+    Returns (residue type set, annotated sequence, atoms per residue,
+    (n_atoms, 3) coordinates). The annotated sequence names every residue
+    type (e.g. HIS_D, CYS:disulfide) so the atom order can be rebuilt.
+    """
+    atoms_per_res, coords = [], []
+    for i in range(1, pose.total_residue() + 1):
+        res = pose.residue(i)
+        atoms_per_res.append(res.natoms())
+        for j in range(1, res.natoms() + 1):
+            xyz = res.xyz(j)
+            coords.append([xyz.x, xyz.y, xyz.z])
+    residue_set = "centroid" if pose.is_centroid() else "fa_standard"
+    return (residue_set, pose.annotated_sequence(), atoms_per_res,
+            np.array(coords, dtype=np.float32))
+
+
+def pose_from_coords(residue_set, annotated_seq, atoms_per_res, coords):
+    pose = pose_from_sequence(annotated_seq, residue_set)
+    k = 0
+    for i in range(1, pose.total_residue() + 1):
+        res = pose.residue(i)
+        if res.natoms() != atoms_per_res[i - 1]:
+            raise ValueError(
+                "Residue %i (%s) has %i atoms, expected %i"
+                % (i, res.name(), res.natoms(), atoms_per_res[i - 1])
+            )
+        for j in range(1, res.natoms() + 1):
+            x, y, z = coords[k]
+            pose.set_xyz(AtomID(j, i), xyzVector_double_t(float(x), float(y), float(z)))
+            k += 1
+    return pose
 
-        except queue.Empty:
-            break
 
+def save_checkpoint(run_dir, seq, scores, dihedrals, n_done):
+    """
+    Atomically write the elite pool (scores and backbone dihedrals) and the
+    number of finished minimizations to `run_dir`/checkpoint.npz.
+    """
+    path = os.path.join(run_dir, "checkpoint.npz")
+    tmp_path = os.path.join(run_dir, "checkpoint.tmp.npz")
+    np.savez(
+        tmp_path,
+        seq=np.array(seq),
+        scores=np.array(scores, dtype=np.float64),
+        dihedrals=np.array(dihedrals, dtype=np.float64).reshape(len(scores), len(seq), 3),
+        n_done=np.array(n_done),
+    )
+    os.replace(tmp_path, path)
 
-def repeat_minimize(seq, constraints, sf, run_dir, n_workers, n_structs, n_iter):
+
+def load_checkpoint(run_dir, seq):
+    """
+    Returns (scores, dihedrals, n_done) from `run_dir`/checkpoint.npz, or
+    None if there is no checkpoint.
+    """
+    path = os.path.join(run_dir, "checkpoint.npz")
+    if not os.path.exists(path):
+        return None
+    ckpt = np.load(path)
+    if str(ckpt["seq"]) != seq:
+        raise ValueError("Checkpoint %s was made for another sequence" % path)
+    print("Resume from %s: %i minimizations done" % (path, int(ckpt["n_done"])))
+    return [float(x) for x in ckpt["scores"]], [d.tolist() for d in ckpt["dihedrals"]], int(ckpt["n_done"])
+
+
+def _snapshot(pose_pool, progress):
+    """
+    Scores, dihedrals and iteration counter of the pool; call with the lock held.
+    """
+    return (
+        [score for score, _ in pose_pool],
+        [pose_dihedrals(pose) for _, pose in pose_pool],
+        progress["done"],
+    )
+
+
+def _write_checkpoint(run_dir, seq, snapshot, progress, io_lock):
+    with io_lock:
+        scores, dihedrals, n_done = snapshot
+        if n_done > progress["saved"]:
+            save_checkpoint(run_dir, seq, scores, dihedrals, n_done)
+            progress["saved"] = n_done
+
+
+def _worker(seq, constraint, sf, run_dir, pose_pool, pool_size, task_queue, mutex,
+            progress, checkpoint_every, io_lock, stop, seeds, tracker):
+    with metrics.profiled():
+        while not stop.is_set():
+            try:
+                idx = task_queue.get(block=False)
+                print("Start minimize %i ................." % idx)
+                with metrics.timed("lock_wait"):
+                    mutex.acquire()
+                if len(pose_pool) < pool_size or np.random.random() < 0.1:
+                    pose = _start_pose(seq, constraint, seeds, idx)
+                else:
+                    p = np.random.randint(len(pose_pool))
+                    pose = pose_pool[p][1].clone()
+                    _add_noise(pose)
+                mutex.release()
+                _minimize_step(sf, pose)
+                score = score_it(sf, pose)
+                snapshot = None
+                with metrics.timed("lock_wait"):
+                    mutex.acquire()
+                pose_pool.append((score, pose))
+                if len(pose_pool) > pool_size:
+                    pose_pool.sort(key=lambda x: x[0])
+                    del pose_pool[-1]
+                progress["done"] += 1
+                done, best = progress["done"], min(x[0] for x in pose_pool)
+                if checkpoint_every and progress["done"] % checkpoint_every == 0:
+                    snapshot = _snapshot(pose_pool, progress)
+                mutex.release()
+                print("Score %i: %f" % (idx, score))
+                tracker.update(done, best)
+                if snapshot is not None:
+                    _write_checkpoint(run_dir, seq, snapshot, progress, io_lock)
+
+            except queue.Empty:
+                break
+
+
+def repeat_minimize(seq, constraints, sf, run_dir, n_workers, n_structs, n_iter,
+                    checkpoint_every=10, resume=False, stop=None, seeds=None):
+    """
+    Returns the pool of the `n_structs` best poses, best first. With
+    `resume`, the pool and iteration counter continue from the checkpoint
+    in `run_dir`. Setting the `stop` event saves a checkpoint of the
+    current pool and returns without waiting for running minimizations.
+    Fresh starts cycle through `seeds` ((L, 3) dihedrals from
+    coarse.coarse_seeds) instead of random basin dihedrals if given.
+    """
     pose_pool = []
+    progress = {"done": 0, "saved": 0}
+    ckpt = load_checkpoint(run_dir, seq) if resume else None
+    if ckpt is not None:
+        scores, dihedrals, progress["done"] = ckpt
+        progress["saved"] = progress["done"]
+        pose_pool = [
+            (score, _pose_from_dihedrals(seq, x, constraints))
+            for score, x in zip(scores, dihedrals)
+        ]
+    stop = stop or threading.Event()
     mutex = threading.Lock()
+    io_lock = threading.Lock()
     q = queue.Queue()
-    for i in range(1, n_iter + 1):
+    for i in range(progress["done"] + 1, n_iter + 1):
         q.put(i)
+    tracker = Progress("builder", n_iter, progress["done"])
     threads = []
     for i in range(n_workers):
         thread = threading.Thread(
             target=_worker,
-            args=(seq, constraints, sf, run_dir, pose_pool, n_structs, q, mutex),
+            args=(seq, constraints, sf, run_dir, pose_pool, n_structs, q, mutex,
+                  progress, checkpoint_every, io_lock, stop, seeds, tracker),
+            daemon=True,
         )
         thread.start()
         threads.append(thread)
     for x in threads:
-        x.join()
-    pose_pool.sort(key=lambda x: score_it(sf, x))
-    return pose_pool
+        # join with a timeout so the main thread can run signal handlers
+        while x.is_alive() and not stop.is_set():
+            x.join(timeout=1)
+    with mutex:
+        pose_pool.sort(key=lambda x: x[0])
+        snapshot = _snapshot(pose_pool, progress)
+        poses = [pose for _, pose in pose_pool]
+    if checkpoint_every:
+        _write_checkpoint(run_dir, seq, snapshot, progress, io_lock)
+    return poses
+
+
+def minimize_from_dihedrals(seq, constraint, sf, start=None, noise=60):
+    """
+    Minimize one decoy, from a random start or from `start` dihedrals
+    perturbed by `noise` degrees.
+    """
+    if start is None:
+        pose = _random_pose(seq, constraint)
+    else:
+        pose = _pose_from_dihedrals(seq, start, constraint)
+        _add_noise(pose, noise)
+    _minimize_step(sf, pose)
+    return pose
+
+
+def queue_minimize(seq, constraints, task_queue, feature_path, run_dir, n_structs, n_iter,
+                   n_inflight, lease, poll=1.0, checkpoint_every=10, resume=False, stop=None,
+                   seeds=None, constraint_budget=None):
+    """
+    Distributed repeat_minimize: decoys are generated by run_worker.py
+    processes pulling tasks from `task_queue`, and merged here into the pool.
+    """
+    stop = stop or threading.Event()
+    pose_pool = []
+    published, collected = 0, 0
+    ckpt = load_checkpoint(run_dir, seq) if resume else None
+    if ckpt is not None:
+        scores, dihedrals, collected = ckpt
+        pose_pool = list(zip(scores, dihedrals))
+        published = collected
+    tracker = Progress("builder", n_iter, collected)
+    inflight = set()
+    while collected < n_iter and not stop.is_set():
+        while published < n_iter and len(inflight) < n_inflight:
+            published += 1
+            noise = 60
+            if len(pose_pool) < n_structs or np.random.random() < 0.1:
+                start = seeds[published % len(seeds)] if seeds else None
+                noise = SEED_NOISE
+            else:
+                start = pose_pool[np.random.randint(len(pose_pool))][1]
+            task_id = "minimize_%06i" % published
+            task_queue.publish(
+                task_id,
+                {"kind": "minimize", "seq": seq, "feature_path": feature_path,
+                 "start": start, "noise": noise, "constraint_budget": constraint_budget},
+            )
+            inflight.add(task_id)
+        for task_id, result in task_queue.collect():
+            if task_id not in inflight:
+                continue
+            if "error" in result:
+                raise RuntimeError("Task %s failed: %s" % (task_id, result["error"]))
+            inflight.discard(task_id)
+            collected += 1
+            metrics.count("minimizations")
+            metrics.add_time("minimize", result["seconds"])
+            pose_pool.append((result["score"], result["dihedrals"]))
+            if len(pose_pool) > n_structs:
+                pose_pool.sort(key=lambda x: x[0])
+                del pose_pool[-1]
+            print("Score %s: %f" % (task_id, result["score"]))
+            tracker.update(collected, min(x[0] for x in pose_pool))
+            if checkpoint_every and collected % checkpoint_every == 0:
+                save_checkpoint(
+                    run_dir, seq, [x[0] for x in pose_pool], [x[1] for x in pose_pool], collected,
+                )
+        if collected < n_iter and not stop.is_set():
+            task_queue.requeue_expired(lease)
+            time.sleep(poll)
+    pose_pool.sort(key=lambda x: x[0])
+    if checkpoint_every:
+        save_checkpoint(
+            run_dir, seq, [x[0] for x in pose_pool], [x[1] for x in pose_pool], collected,
+        )
+    return [_pose_from_dihedrals(seq, dihedrals, constraints) for _, dihedrals in pose_pool]
 
 
 def relax(pose):
@@ -121,3 +363,4 @@ def relax(pose):
     switch = SwitchResidueTypeSetMover("fa_standard")
     switch.apply(pose)
     relax.apply(pose)
+    return sf
@@ -0,0 +1,52 @@
+"""
+Machine-readable progress events, printed as single stdout lines
+
+    PROGRESS {"stage": "builder", "done": 12, "total": 100, "best": -310.2, "eta": 540.0}
+
+between the human-readable log lines, for the GUI and other front ends.
+"""
+import json
+import time
+
+PREFIX = "PROGRESS "
+
+
+def emit(stage, **fields):
+    print(PREFIX + json.dumps(dict(stage=stage, **fields)), flush=True)
+
+
+def parse_event(line):
+    """
+    The event dict of a progress line, or None for any other line.
+    """
+    if not line.startswith(PREFIX):
+        return None
+    try:
+        return json.loads(line[len(PREFIX):])
+    except ValueError:
+        return None
+
+
+class Progress:
+    """
+    Count finished work items of a stage and emit an event for each, with
+    the ETA extrapolated from the items finished since the start.
+    """
+
+    def __init__(self, stage, total, done=0):
+        self.stage = stage
+        self.total = total
+        self.done = done
+        self._start_done = done
+        self._start = time.time()
+        emit(stage, done=done, total=total)
+
+    def update(self, done=None, best=None):
+        self.done = self.done + 1 if done is None else done
+        rate = (self.done - self._start_done) / max(time.time() - self._start, 1e-6)
+        fields = {"done": self.done, "total": self.total}
+        if best is not None:
+            fields["best"] = best
+        if rate > 0:
+            fields["eta"] = round(max(self.total - self.done, 0) / rate, 1)
+        emit(self.stage, **fields)
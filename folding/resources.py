@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+"""
+Worker counts from the host and the target size.
+
+The cores this process may use and the available memory (cgroup v1 or v2
+CPU quota and memory limit included) are split per stage with rough memory
+estimates as a function of the sequence length L:
+
+  inference  torch and the TorchScript ensemble, L x L activations and
+             distograms; one process, threads only cost cores
+  builder    one PyRosetta process with the constraint splines, a centroid
+             pose per worker thread
+  relax      forked PyRosetta processes, each with a full-atom pose and its
+             own constraint set
+
+    python folding/resources.py <L>
+
+prints the plan for this host.
+"""
+import math
+import os
+import sys
+
+MiB = 2 ** 20
+# Rough footprints, enough to keep clear of the OOM killer, not to budget
+# memory exactly.
+TORCH_MB = 1500             # torch with the model ensemble loaded
+ROSETTA_MB = 1000           # PyRosetta with the full-atom database
+N_MODELS = 5
+PAIR_FEATURE_BYTES = 100 * 4      # cbcb, omega, theta and phi bins, float32
+PAIR_ACTIVATION_BYTES = 4096      # inference activations per residue pair
+PAIR_CONSTRAINT_BYTES = 100 * 8 * 2  # spline potentials, numpy and Rosetta
+RESIDUE_POSE_BYTES = 20000        # full-atom residue with its relax state
+# Share of the available memory the plan may fill.
+MEMORY_FRACTION = 0.8
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _cgroup_cores():
+    """
+    Cores of the cgroup CPU quota, v2 cpu.max or v1 cfs, or None without one.
+    """
+    quota = _read("/sys/fs/cgroup/cpu.max")
+    if quota:
+        quota, period = quota.split()[:2]
+        if quota == "max":
+            return None
+    else:
+        for cpu_dir in ("/sys/fs/cgroup/cpu", "/sys/fs/cgroup/cpu,cpuacct"):
+            quota = _read(os.path.join(cpu_dir, "cpu.cfs_quota_us"))
+            period = _read(os.path.join(cpu_dir, "cpu.cfs_period_us"))
+            if quota and period:
+                break
+        else:
+            return None
+        if int(quota) <= 0:  # -1: no quota
+            return None
+    return math.ceil(int(quota) / int(period))
+
+
+def _cgroup_memory():
+    """
+    MiB left under the cgroup memory limit, v2 or v1, or None without one.
+    """
+    limit = _read("/sys/fs/cgroup/memory.max")
+    usage = _read("/sys/fs/cgroup/memory.current")
+    if limit is None:
+        limit = _read("/sys/fs/cgroup/memory/memory.limit_in_bytes")
+        usage = _read("/sys/fs/cgroup/memory/memory.usage_in_bytes")
+    if not limit or not usage or limit.strip() == "max":
+        return None
+    # v1 reports no limit as a huge number, which min() below ignores
+    return (int(limit) - int(usage)) / MiB
+
+
+def host_resources():
+    """
+    (cores usable by this process, available memory in MiB), cgroup v1 or v2
+    CPU quota and memory limit included.
+    """
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    quota_cores = _cgroup_cores()
+    if quota_cores:
+        cores = max(1, min(cores, quota_cores))
+    memory = None
+    meminfo = _read("/proc/meminfo")
+    if meminfo:
+        for line in meminfo.splitlines():
+            if line.startswith("MemAvailable:"):
+                memory = int(line.split()[1]) / 1024
+    if memory is None:
+        memory = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / MiB
+    cgroup_memory = _cgroup_memory()
+    if cgroup_memory is not None:
+        memory = min(memory, cgroup_memory)
+    return cores, memory
+
+
+def stage_memory(L):
+    """
+    {stage: (MiB shared by the stage, MiB per worker)} for length `L`.
+    """
+    pairs = L * L
+    return {
+        "inference": (
+            TORCH_MB + pairs * (PAIR_ACTIVATION_BYTES + PAIR_FEATURE_BYTES * (N_MODELS + 1)) / MiB,
+            0,
+        ),
+        "builder": (
+            ROSETTA_MB + pairs * (PAIR_FEATURE_BYTES + PAIR_CONSTRAINT_BYTES) / MiB,
+            2 * L * RESIDUE_POSE_BYTES / MiB,  # the pose and its pool copy
+        ),
+        "relax": (
+            pairs * PAIR_FEATURE_BYTES / MiB,
+            ROSETTA_MB + (pairs * PAIR_CONSTRAINT_BYTES + L * RESIDUE_POSE_BYTES) / MiB,
+        ),
+    }
+
+
+def plan(L, n_structs=None, cores=None, memory=None):
+    """
+    {stage: number of threads or workers} for a target of length `L`: one
+    per core, fewer if their memory would not fit. Relax gets no more
+    workers than the `n_structs` decoys it has to relax.
+    """
+    host_cores, host_memory = host_resources()
+    cores = cores or host_cores
+    usable = (memory or host_memory) * MEMORY_FRACTION
+    result = {}
+    for stage, (shared, per_worker) in stage_memory(L).items():
+        n = cores
+        if per_worker:
+            n = min(n, int((usable - shared) // per_worker))
+        if shared + per_worker > usable:
+            print("Warning: %s of L=%i needs about %.0f MiB, %.0f MiB available"
+                  % (stage, L, shared + per_worker, usable))
+        result[stage] = max(1, n)
+    if n_structs:
+        result["relax"] = min(result["relax"], n_structs)
+    return result
+
+
+def workers(value, stage, L, **kwargs):
+    """
+    Resolve a worker or thread count option: an int, or "auto" for the
+    `stage` count of plan(L, **kwargs).
+    """
+    if str(value) != "auto":
+        return int(value)
+    n = plan(L, **kwargs)[stage]
+    print("Resource plan: %i %s workers for L=%i" % (n, stage, L))
+    return n
+
+
+def query_length(path):
+    """
+    Length of the first sequence of a FASTA or ALN file (with or without
+    header lines).
+    """
+    with open(path) as f:
+        first = f.readline()
+        if not first.startswith(">"):
+            return len(first.strip())
+        length = 0
+        for line in f:
+            if line.startswith(">"):
+                break
+            length += len(line.strip())
+    return length
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: %s <sequence length>" % sys.argv[0])
+        sys.exit(1)
+    L = int(sys.argv[1])
+    cores, memory = host_resources()
+    print("%i cores, %.0f MiB available" % (cores, memory))
+    for stage, n in plan(L).items():
+        shared, per_worker = stage_memory(L)[stage]
+        print("%-10s %3i  (%.0f MiB + %.0f MiB per worker)" % (stage, n, shared, per_worker))
@@ -1,40 +1,133 @@
 #!/usr/bin/env python
 import os
+import sys
+import signal
+import threading
 import click
+import numpy as np
 import pyrosetta
 from pyrosetta import rosetta
 from constraints import Constraints
-from score import geo_sf
-from minimizer import repeat_minimize
+from score import geo_sf, score_it
+from coarse import coarse_seeds
+from minimizer import repeat_minimize, queue_minimize, pose_coords
+from decoys import DecoyWriter
+from fsqueue import TaskQueue, spawn_workers, stop_workers
+from resources import workers
+from validate import check_constraints
+import metrics
+
+
+def build(seq, feature, output_dir, n_workers, n_structs, n_iter, queue_dir=None,
+          lease=1800, n_inflight=0, checkpoint_every=10, resume=False, stop=None, n_seeds=0,
+          constraint_budget=None):
+    """
+    Returns (the `n_structs` best centroid poses, best first, their score
+    function); pyrosetta.init must have been called. `feature` is the
+    feature npz path or its arrays (a path in queue mode). The poses are
+    incomplete if the `stop` event was set. `constraint_budget` limits the
+    constraints per residue of each type (see Constraints._select).
+    """
+    seq_no_g = "".join(["A" if _ == "G" else _ for _ in list(seq)])
+    raw_constraints = Constraints(seq, feature)
+    constraints = raw_constraints.get_constraint_v1(constraint_budget)
+    # fail before hours of minimization on a broken constraint set
+    check_constraints(raw_constraints.cst_file, len(seq))
+    score_function = geo_sf(dist_weight=5, dihedral_weight=1, angle_weight=1)
+    stop = stop or threading.Event()
+    seeds = None
+    if n_seeds > 0:
+        cbcb = np.load(feature)["cbcb"] if isinstance(feature, str) else feature["cbcb"]
+        seeds = [x.tolist() for x in coarse_seeds(cbcb, n_seeds)]
+        print("Coarse folded %i seeds" % n_seeds)
+    if queue_dir:
+        # Distributed mode: n_workers local workers, more may join from other hosts.
+        task_queue = TaskQueue(queue_dir)
+        print("Queue run %s in %s" % (task_queue.run, queue_dir))
+        procs = spawn_workers(queue_dir, n_workers, lease, task_queue.run)
+        try:
+            poses = queue_minimize(
+                seq_no_g, constraints, task_queue, os.path.abspath(feature), output_dir,
+                n_structs, n_iter, n_inflight or max(n_structs, n_workers), lease,
+                checkpoint_every=checkpoint_every, resume=resume, stop=stop, seeds=seeds,
+                constraint_budget=constraint_budget,
+            )
+        finally:
+            stop_workers(task_queue, procs)
+    else:
+        poses = repeat_minimize(
+            seq_no_g, constraints, score_function, output_dir, n_workers, n_structs, n_iter,
+            checkpoint_every=checkpoint_every, resume=resume, stop=stop, seeds=seeds,
+        )
+    if stop.is_set():
+        return poses, score_function
+    for i, a in enumerate(seq):
+        if a == "G":
+            mutator = rosetta.protocols.simple_moves.MutateResidue(i + 1, "GLY")
+            for pose in poses:
+                mutator.apply(pose)
+    return poses, score_function
 
 
 @click.command()
 @click.option("-i", "--fasta_path", required=True, type=click.Path(exists=True))
 @click.option("-f", "--feature_path", required=True, type=click.Path(exists=True))
 @click.option("-o", "--output_dir", required=True, type=click.Path())
-@click.option("-nw", "--n_workers", default=24, type=int)
+@click.option("-nw", "--n_workers", default="auto", type=str)
 @click.option("-ns", "--n_structs", default=20, type=int)
 @click.option("-ni", "--n_iter", default=100, type=int)
-def main(fasta_path, feature_path, output_dir, n_workers, n_structs, n_iter):
+@click.option("-q", "--queue_dir", default=None, type=click.Path())
+@click.option("--lease", default=1800, type=int)
+@click.option("--n_inflight", default=0, type=int)
+@click.option("--checkpoint_every", default=10, type=int)
+@click.option("--resume", is_flag=True, default=False)
+# The default; kept so existing command lines still work.
+@click.option("--overwrite_checkpoint", is_flag=True, default=False)
+@click.option("--keep_checkpoint", is_flag=True, default=False)
+@click.option("-d", "--decoy_file", default=None, type=click.Path())
+@click.option("--coarse_seeds", "n_seeds", default=0, type=int)
+@click.option("--constraint_budget", default=0.0, type=float)
+def main(fasta_path, feature_path, output_dir, n_workers, n_structs, n_iter,
+         queue_dir, lease, n_inflight, checkpoint_every, resume, overwrite_checkpoint,
+         keep_checkpoint, decoy_file, n_seeds, constraint_budget):
+    """
+    A checkpoint left in `output_dir` is only read with --resume, and is
+    overwritten otherwise; --keep_checkpoint refuses to start instead.
+    """
     pyrosetta.init(
         "-hb_cen_soft -relax:default_repeats 5 -default_max_cycles 200 -out:level 100"
     )
     os.makedirs(output_dir, exist_ok=True)
+    checkpoint = os.path.join(output_dir, "checkpoint.npz")
+    if keep_checkpoint and not resume and os.path.exists(checkpoint):
+        raise click.UsageError(
+            "%s exists: continue it with --resume or run without --keep_checkpoint" % checkpoint
+        )
+    # SIGTERM (e.g. the GUI stop button) saves the pool before exiting.
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
 
     name = os.path.splitext(os.path.basename(fasta_path))[0]
     seq = open(fasta_path).readlines()[1].strip()
-    seq_no_g = "".join(["A" if _ == "G" else _ for _ in list(seq)])
-    raw_constraints = Constraints(seq, feature_path)
-    constraints = raw_constraints.get_constraint_v1()
-    score_function = geo_sf(dist_weight=5, dihedral_weight=1, angle_weight=1)
-    poses = repeat_minimize(
-        seq_no_g, constraints, score_function, output_dir, n_workers, n_structs, n_iter,
+    # Queue workers are PyRosetta processes of their own, sized like relax ones.
+    n_workers = workers(n_workers, "relax" if queue_dir else "builder", len(seq))
+    poses, score_function = build(
+        seq, feature_path, output_dir, n_workers, n_structs, n_iter,
+        queue_dir=queue_dir, lease=lease, n_inflight=n_inflight,
+        checkpoint_every=checkpoint_every, resume=resume, stop=stop, n_seeds=n_seeds,
+        constraint_budget=constraint_budget or None,
     )
-    for i, a in enumerate(seq):
-        if a == "G":
-            mutator = rosetta.protocols.simple_moves.MutateResidue(i + 1, "GLY")
-            for pose in poses:
-                mutator.apply(pose)
+    if stop.is_set():
+        print("Stopped, continue with --resume from %s" % checkpoint)
+        sys.exit(128 + signal.SIGTERM)
+    if decoy_file:
+        with DecoyWriter(decoy_file) as writer:
+            for i, pose in enumerate(poses):
+                writer.write(
+                    "%s_%02i" % (name, i), score_it(score_function, pose), seq,
+                    *pose_coords(pose),
+                )
+        return
     os.makedirs(os.path.join(output_dir, "final"), exist_ok=True)
     for i, pose in enumerate(poses):
         path = os.path.join(output_dir, "final", "%s_%02i.pdb" % (name, i))
@@ -42,4 +135,5 @@ def main(fasta_path, feature_path, output_dir, n_workers, n_structs, n_iter):
 
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("builder"):
+        main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+import os
+import click
+from decoys import DecoyReader
+import metrics
+
+
+@click.command()
+@click.option("-i", "--decoy_file", required=True, type=click.Path(exists=True))
+@click.option("-o", "--rank_path", required=True, type=click.Path())
+@click.option("-e", "--export_dir", default=None, type=click.Path())
+@click.option("-n", "--n_export", default=5, type=int)
+def main(decoy_file, rank_path, export_dir, n_export):
+    """
+    rank the decoys of a container by score and export the top ones as PDB
+    """
+    with DecoyReader(decoy_file) as reader:
+        ranking = sorted(reader.scores(), key=lambda x: x[1])
+        exported = {}
+        if export_dir and n_export > 0:
+            import pyrosetta
+            from minimizer import pose_from_coords
+
+            pyrosetta.init("-out:level 100")
+            os.makedirs(export_dir, exist_ok=True)
+            for tag, _ in ranking[:n_export]:
+                header, atoms_per_res, coords = reader.read(tag)
+                pose = pose_from_coords(
+                    header["residue_set"], header["annotated_seq"], atoms_per_res, coords
+                )
+                exported[tag] = os.path.join(export_dir, tag + ".pdb")
+                pose.dump_pdb(exported[tag])
+
+    with open(rank_path, "w") as f:
+        for tag, score in ranking:
+            f.write("%s %f\n" % (exported.get(tag, "%s:%s" % (decoy_file, tag)), score))
+
+
+if __name__ == "__main__":
+    with metrics.stage("rank"):
+        main()
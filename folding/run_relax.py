@@ -1,11 +1,18 @@
 #!/usr/bin/env python
 import os
+import time
 import click
 import pyrosetta
+import multiprocessing
 from multiprocessing import Pool
-from pyrosetta import pose_from_pdb
+from pyrosetta import pose_from_pdb, SwitchResidueTypeSetMover
 from constraints import Constraints
-from minimizer import relax
+from minimizer import relax, pose_coords, pose_from_coords
+from decoys import DecoyReader, DecoyWriter, read_record
+from fsqueue import TaskQueue, spawn_workers, stop_workers
+from progress import Progress
+from resources import workers
+import metrics
 
 
 def relex_from_pdb(seq, feature_path, input_pdb, output_pdb):
@@ -17,18 +24,171 @@ def relex_from_pdb(seq, feature_path, input_pdb, output_pdb):
     pose.dump_pdb(output_pdb)
 
 
+def _timed(fn, *args):
+    """
+    (seconds, result, metrics of the task) of a pool task.
+    """
+    metrics.take()  # drop the counters inherited from the parent
+    t = time.time()
+    result = fn(*args)
+    return time.time() - t, result, metrics.take()
+
+
+def _relex_from_pdb(args):
+    return _timed(relex_from_pdb, *args)
+
+
+def relax_from_container(seq, feature_path, decoy_file, header):
+    atoms_per_res, coords = read_record(decoy_file, header)
+    pose = pose_from_coords(header["residue_set"], header["annotated_seq"], atoms_per_res, coords)
+    SwitchResidueTypeSetMover("fa_standard").apply(pose)
+    raw_constraints = Constraints(seq, feature_path)
+    constraints = raw_constraints.get_constraint_v1_fix_gly()
+    constraints.apply(pose)
+    sf = relax(pose)
+    return (header["tag"], sf(pose), header["seq"]) + pose_coords(pose)
+
+
+def _relax_from_container(args):
+    return _timed(relax_from_container, *args)
+
+
+# Inherited by the forked workers of relax_poses instead of being pickled.
+_shared = {}
+
+
+def _init_shared_worker():
+    _shared["constraints"] = Constraints(_shared["seq"], _shared["feature"])
+    _shared["mover"] = _shared["constraints"].get_constraint_v1_fix_gly()
+
+
+def _relax_shared(i):
+    return _timed(_relax_shared_pose, i)
+
+
+def _relax_shared_pose(i):
+    pose = _shared["poses"][i].clone()
+    SwitchResidueTypeSetMover("fa_standard").apply(pose)
+    _shared["mover"].apply(pose)
+    sf = relax(pose)
+    pose.dump_pdb(_shared["output_paths"][i])
+    return _shared["output_paths"][i], sf(pose)
+
+
+def relax_poses(seq, feature, poses, output_paths, n_workers):
+    """
+    Relax in-memory poses in `n_workers` forked processes, which inherit
+    PyRosetta, the poses and the features from this one. Each relaxed pose
+    is written to its output path; returns [(output_path, score)].
+    """
+    _shared.update(seq=seq, feature=feature, poses=poses, output_paths=output_paths)
+    try:
+        with multiprocessing.get_context("fork").Pool(
+            n_workers, initializer=_init_shared_worker
+        ) as p:
+            results = []
+            tracker = Progress("relax", len(poses))
+            for seconds, (path, score), taken in p.imap_unordered(
+                _relax_shared, range(len(poses))
+            ):
+                metrics.add(taken)
+                metrics.record("relax_seconds", seconds)
+                print("Relaxed %s: %f" % (path, score))
+                results.append((path, score))
+                tracker.update(best=min(x[1] for x in results))
+    finally:
+        _shared.clear()
+    return results
+
+
+def queue_relax(seq, feature_path, input_dir, output_dir, queue_dir, n_workers, lease):
+    """
+    Publish one relax task per decoy and wait for run_worker.py processes
+    (n_workers local ones plus any joining from other hosts) to finish them.
+    """
+    task_queue = TaskQueue(queue_dir)
+    task_ids = []
+    for path in sorted(os.listdir(input_dir)):
+        task_id = "relax_%s" % os.path.splitext(path)[0]
+        task_queue.publish(
+            task_id,
+            {
+                "kind": "relax",
+                "seq": seq,
+                "feature_path": os.path.abspath(feature_path),
+                "input_pdb": os.path.abspath(os.path.join(input_dir, path)),
+                "output_pdb": os.path.abspath(os.path.join(output_dir, path)),
+            },
+        )
+        task_ids.append(task_id)
+    print("Queue run %s in %s" % (task_queue.run, queue_dir))
+    procs = spawn_workers(queue_dir, n_workers, lease, task_queue.run)
+    tracker = Progress("relax", len(task_ids))
+    try:
+        for task_id, result in task_queue.drain(task_ids, lease):
+            if "error" in result:
+                raise RuntimeError("Task %s failed: %s" % (task_id, result["error"]))
+            print("Relaxed %s" % result["output_pdb"])
+            metrics.record("relax_seconds", result["seconds"])
+            tracker.update()
+    finally:
+        stop_workers(task_queue, procs)
+
+
 @click.command()
 @click.option("-s", "--fasta_path", required=True, type=click.Path(exists=True))
 @click.option("-f", "--feature_path", required=True, type=click.Path(exists=True))
 @click.option("-i", "--input_dir", required=True, type=click.Path())
 @click.option("-o", "--output_dir", required=True, type=click.Path())
-@click.option("-nw", "--n_workers", default=24, type=int)
-def main(fasta_path, feature_path, input_dir, output_dir, n_workers):
+@click.option("-nw", "--n_workers", default="auto", type=str)
+@click.option("-q", "--queue_dir", default=None, type=click.Path())
+@click.option("--lease", default=1800, type=int)
+@click.option("-d", "--decoy_file", default=None, type=click.Path())
+def main(fasta_path, feature_path, input_dir, output_dir, n_workers, queue_dir, lease,
+         decoy_file):
+    """
+    relax every decoy of `input_dir`, a directory of PDBs or a decoy container
+    written by run_builder.py --decoy_file
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    seq = open(fasta_path).readlines()[1].strip()
+    if n_workers == "auto":
+        # the decoys only bound the plan; opening the container is not free
+        if os.path.isfile(input_dir):
+            with DecoyReader(input_dir) as reader:
+                n_decoys = len(reader.headers)
+        else:
+            n_decoys = sum(path.endswith(".pdb") for path in os.listdir(input_dir))
+        n_workers = workers(n_workers, "relax", len(seq), n_structs=n_decoys)
+    n_workers = int(n_workers)
+    if os.path.isfile(input_dir):
+        if queue_dir:
+            raise click.UsageError("--queue_dir needs a directory of PDBs as input")
+        if not decoy_file:
+            decoy_file = os.path.join(output_dir, os.path.basename(input_dir))
+        pyrosetta.init(
+            "-hb_cen_soft -relax:default_repeats 5 -default_max_cycles 200 -out:level 100"
+        )
+        # Workers read their record directly at its indexed offset.
+        with DecoyReader(input_dir) as reader:
+            args = [(seq, feature_path, input_dir, header) for header in reader.headers]
+        tracker = Progress("relax", len(args))
+        with Pool(n_workers) as p, DecoyWriter(decoy_file) as writer:
+            best = None
+            for seconds, result, taken in p.imap_unordered(_relax_from_container, args):
+                metrics.add(taken)
+                metrics.record("relax_seconds", seconds)
+                writer.write(*result)
+                print("Relaxed %s: %f" % (result[0], result[1]))
+                best = result[1] if best is None else min(best, result[1])
+                tracker.update(best=best)
+        return
+    if queue_dir:
+        queue_relax(seq, feature_path, input_dir, output_dir, queue_dir, n_workers, lease)
+        return
     pyrosetta.init(
         "-hb_cen_soft -relax:default_repeats 5 -default_max_cycles 200 -out:level 100"
     )
-    os.makedirs(output_dir, exist_ok=True)
-    seq = open(fasta_path).readlines()[1].strip()
     with Pool(n_workers) as p:
         args = []
         for path in os.listdir(input_dir):
@@ -40,8 +200,13 @@ def main(fasta_path, feature_path, input_dir, output_dir, n_workers):
                     os.path.join(output_dir, path),
                 )
             )
-        p.starmap(relex_from_pdb, args)
+        tracker = Progress("relax", len(args))
+        for seconds, _, taken in p.imap_unordered(_relex_from_pdb, args):
+            metrics.add(taken)
+            metrics.record("relax_seconds", seconds)
+            tracker.update()
 
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("relax"):
+        main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+import click
+import pyrosetta
+from constraints import Constraints
+from score import geo_sf, score_it
+from minimizer import minimize_from_dihedrals, pose_dihedrals
+from fsqueue import TaskQueue, serve
+from run_relax import relex_from_pdb
+
+_constraints = {}
+
+
+def _get_constraint(seq, feature_path, budget=None):
+    key = (seq, feature_path, budget)
+    if key not in _constraints:
+        # keep Constraints alive: its temporary directory holds the spline files
+        raw_constraints = Constraints(seq, feature_path)
+        _constraints[key] = raw_constraints, raw_constraints.get_constraint_v1(budget)
+    return _constraints[key][1]
+
+
+def run_task(task, sf):
+    if task["kind"] == "minimize":
+        constraint = _get_constraint(
+            task["seq"], task["feature_path"], task.get("constraint_budget")
+        )
+        pose = minimize_from_dihedrals(
+            task["seq"], constraint, sf, task["start"], task.get("noise", 60)
+        )
+        return {
+            "score": score_it(sf, pose),
+            "dihedrals": pose_dihedrals(pose),
+        }
+    if task["kind"] == "relax":
+        relex_from_pdb(task["seq"], task["feature_path"], task["input_pdb"], task["output_pdb"])
+        return {"output_pdb": task["output_pdb"]}
+    raise ValueError("Unknown task kind: %s" % task["kind"])
+
+
+@click.command()
+@click.option("-q", "--queue_dir", required=True, type=click.Path())
+@click.option("--lease", default=1800, type=int)
+@click.option("--poll", default=2.0, type=float)
+@click.option("--idle_timeout", default=0, type=int)
+@click.option("--run", default=None, type=str)
+def main(queue_dir, lease, poll, idle_timeout, run):
+    """
+    pull minimize/relax tasks from a shared queue directory until it is stopped
+
+    With --run, only tasks of that run are served and the worker exits when
+    the run's coordinator finishes. Otherwise the worker serves every run and
+    exits on a STOP file in the queue directory or after --idle_timeout
+    seconds without tasks.
+    """
+    pyrosetta.init(
+        "-hb_cen_soft -relax:default_repeats 5 -default_max_cycles 200 -out:level 100"
+    )
+    sf = geo_sf(dist_weight=5, dihedral_weight=1, angle_weight=1)
+    serve(TaskQueue(queue_dir), lambda task: run_task(task, sf), lease,
+          poll=poll, idle_timeout=idle_timeout, run=run)
+
+
+if __name__ == "__main__":
+    main()
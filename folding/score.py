@@ -1,5 +1,6 @@
 import pyrosetta
 from pyrosetta import ScoreFunction
+import metrics
 
 
 def geo_sf(dist_weight=5, dihedral_weight=1, angle_weight=1):
@@ -11,4 +12,5 @@ def geo_sf(dist_weight=5, dihedral_weight=1, angle_weight=1):
 
 
 def score_it(sf, pose):
+    metrics.count("score_evaluations")
     return sf(pose)
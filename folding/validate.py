@@ -0,0 +1,217 @@
+"""
+Fail-fast checks of the inputs of the expensive stages: the alignment
+before inference and the constraint file before minimization. Both stream
+their file and raise ValueError on the first problem found.
+"""
+import os
+import warnings
+import numpy as np
+
+# run_inference.parse_feature maps any other letter to an error.
+AMINO = b"ACDEFGHIKLMNPQRSTVWY-XBZUOJ"
+_VALID = AMINO + AMINO.lower()
+
+# Constraint types written by Constraints and the number of atoms of each.
+N_ATOMS = {"AtomPair": 2, "Angle": 3, "Dihedral": 4}
+# Their first two letters are distinct: lines are sorted by type with them.
+_PREFIX = {kind[:2]: kind for kind in N_ATOMS}
+
+
+def _records(f):
+    """
+    (1-based record number, sequence) of a FASTA file opened in binary.
+    """
+    n, chunks = 0, None
+    for line in f:
+        if line.startswith(b">"):
+            if chunks is not None:
+                yield n, b"".join(chunks)
+            n, chunks = n + 1, []
+        elif chunks is not None:
+            chunks.append(line.strip())
+    if chunks is not None:
+        yield n, b"".join(chunks)
+
+
+def check_aln(aln_path, min_seqs=2):
+    """
+    Check that an ALN file has at least `min_seqs` sequences of the query
+    length, made of letters run_inference.py knows. Returns (number of
+    sequences, length, number of distinct sequences).
+    """
+    length, n_seqs, distinct = None, 0, set()
+    with open(aln_path, "rb") as f:
+        for n, seq in _records(f):
+            if length is None:
+                length = len(seq)
+            elif len(seq) != length:
+                raise ValueError(
+                    "%s: sequence %i has length %i, the query %i" % (aln_path, n, len(seq), length)
+                )
+            invalid = seq.translate(None, _VALID)
+            if invalid:
+                raise ValueError(
+                    "%s: invalid character %r in sequence %i"
+                    % (aln_path, invalid[:1].decode(errors="replace"), n)
+                )
+            distinct.add(hash(seq.upper()))
+            n_seqs = n
+    if n_seqs < min_seqs:
+        raise ValueError("%s: %i sequences, at least %i needed" % (aln_path, n_seqs, min_seqs))
+    if len(distinct) < 2:
+        print("Warning: %s has %i distinct sequences" % (aln_path, len(distinct)))
+    return n_seqs, length, len(distinct)
+
+
+def _column(cols, c):
+    """
+    Column `c` parsed as float64 in one call, or None if a field is not a
+    number.
+    """
+    with warnings.catch_warnings():
+        # fromstring stops at the first bad field and warns
+        warnings.simplefilter("ignore", DeprecationWarning)
+        values = np.fromstring(" ".join(cols[c]), sep=" ")
+    return values if len(values) == len(cols[c]) else None
+
+
+def _check_block(cst_path, kind, cols, line_numbers, L):
+    """
+    Check the constraints of one type, function and field count, given as
+    columns: residue indices in 1..L and finite parameters. Returns the
+    spline files. `line_numbers(k)` is the line of the k-th constraint.
+    """
+    n_atoms = N_ATOMS[kind]
+    func_col = 2 * n_atoms + 1
+    spline = len(cols) > func_col and cols[func_col][0] == "SPLINE"
+    # SPLINE <tag> <file> <params>; other functions take parameters only
+    first = func_col + (3 if spline else 1)
+    if len(cols) <= first:
+        raise ValueError("%s:%i: too few fields" % (cst_path, line_numbers(0)))
+    bad = np.zeros(len(cols[0]), dtype=bool)
+    for c in range(2, 2 * n_atoms + 1, 2):
+        residues = _column(cols, c)
+        if residues is None:
+            residues = np.array([int(x) if x.isdigit() else 0 for x in cols[c]])
+        bad |= (residues < 1) | (residues > L) | (residues != np.floor(residues))
+    if bad.any():
+        raise ValueError("%s:%i: residue index outside 1..%i or not a number"
+                         % (cst_path, line_numbers(np.argmax(bad)), L))
+    for c in range(first, len(cols)):
+        params = _column(cols, c)
+        if params is None:
+            params = np.array([_float(x) for x in cols[c]])
+        bad |= ~np.isfinite(params)
+    if bad.any():
+        raise ValueError("%s:%i: parameters are not finite numbers"
+                         % (cst_path, line_numbers(np.argmax(bad))))
+    return cols[func_col + 2] if spline else []
+
+
+def _float(x):
+    try:
+        return float(x)
+    except ValueError:
+        return np.nan
+
+
+def _check_files(cst_path, paths, lines):
+    """
+    Check that the spline files exist, with one listdir per directory.
+    """
+    if not paths:
+        return
+    # Usually all in one directory: strip it from the joined paths at once.
+    directory = paths[0].rpartition("/")[0]
+    joined = "\n".join(paths)
+    if directory and joined.count(directory + "/") == len(paths):
+        names = joined.replace(directory + "/", "")
+        if "/" not in names:
+            missing = set(names.split("\n")) - set(os.listdir(directory)) \
+                if os.path.isdir(directory) else set(names.split("\n"))
+            if missing:
+                name = sorted(missing)[0]
+                n = next(n for n, line in enumerate(lines, start=1) if name in line)
+                raise ValueError("%s:%i: spline file %s does not exist"
+                                 % (cst_path, n, os.path.join(directory, name)))
+            return
+    by_dir = {}
+    for path in set(paths):
+        directory, _, name = path.rpartition("/")
+        by_dir.setdefault(directory, set()).add(name)
+    for directory, names in by_dir.items():
+        directory = directory or "."
+        missing = names - set(os.listdir(directory)) if os.path.isdir(directory) else names
+        if missing:
+            name = sorted(missing)[0]
+            n = next(n for n, line in enumerate(lines, start=1) if name in line)
+            raise ValueError("%s:%i: spline file %s does not exist"
+                             % (cst_path, n, os.path.join(directory, name)))
+
+
+def _groups(lines):
+    """
+    {(type, function, field count): (columns, line numbers)} of numbered
+    lines.
+    """
+    groups = {}
+    for n, line in lines:
+        fields = line.split()
+        if fields and fields[0] in N_ATOMS:
+            func_col = 2 * N_ATOMS[fields[0]] + 1
+            func = fields[func_col] if len(fields) > func_col else None
+            rows, line_numbers = groups.setdefault((fields[0], func, len(fields)), ([], []))
+            rows.append(fields)
+            line_numbers.append(n)
+    return {key: (list(zip(*rows)), numbers) for key, (rows, numbers) in groups.items()}
+
+
+def check_constraints(cst_path, L):
+    """
+    Check a Rosetta constraint file for a sequence of length `L`. Returns
+    {constraint type: count}, other types than N_ATOMS counted as Other.
+
+    The lines are sorted by type in one pass. The lines of a type usually
+    share one layout: they are split all at once and checked by column;
+    otherwise line by line.
+    """
+    with open(cst_path) as f:
+        lines = f.read().splitlines()
+    blocks = {kind: ([], []) for kind in N_ATOMS}
+    n_other = 0
+    for n, line in enumerate(lines, start=1):
+        kind = _PREFIX.get(line[:2])
+        if kind is None:
+            n_other += bool(line.strip()) and not line.startswith("#")
+            continue
+        block, numbers = blocks[kind]
+        block.append(line)
+        numbers.append(n)
+    counts, splines = {}, []
+    for kind, (block, numbers) in blocks.items():
+        counts[kind] = len(block)
+        if not block:
+            continue
+        tokens = " ".join(block).split()
+        n_fields = len(tokens) // len(block)
+        cols = [tokens[c::n_fields] for c in range(n_fields)]
+        func_col = 2 * N_ATOMS[kind] + 1
+        # a shifted line moves the type name out of the first column
+        uniform = (
+            n_fields * len(block) == len(tokens)
+            and cols[0].count(kind) == len(block)
+            and n_fields > func_col
+            and cols[func_col].count(cols[func_col][0]) == len(block)
+        )
+        if uniform:
+            splines += _check_block(cst_path, kind, cols, numbers.__getitem__, L)
+            continue
+        groups = _groups(zip(numbers, block))
+        counts[kind] = sum(len(group_numbers) for group_numbers in
+                           [g for (k, _, _), (_, g) in groups.items() if k == kind])
+        n_other += len(block) - sum(len(g) for _, g in groups.values())
+        for (kind_, _, _), (cols, group_numbers) in groups.items():
+            splines += _check_block(cst_path, kind_, cols, group_numbers.__getitem__, L)
+    _check_files(cst_path, splines, lines)
+    counts["Other"] = n_other
+    return counts
@@ -1,4 +1,4 @@
-import os, sys, threading
+import os, sys, signal, threading
 from multiprocessing import Process, Queue
 from PyQt6.QtWidgets import (
     QApplication,
@@ -16,29 +16,38 @@ from PyQt6.QtWidgets import (
     QTabWidget,
     QFormLayout,
     QSpinBox,
+    QCheckBox,
+    QProgressBar,
 )
-from PyQt6.QtCore import QProcess, Qt
+from PyQt6.QtCore import QProcess, Qt, QTimer
 from PyQt6.QtGui import QGuiApplication
 from PyQt6.QtWebEngineWidgets import QWebEngineView
 import qdarkstyle
 
 import py3Dmol
-import pipeline
 
 root_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(root_dir, "folding"))
+from progress import parse_event
+
 work_dir = os.path.join(root_dir, "work_dir")
 log_dir = os.path.join(work_dir, "log")
 
 os.makedirs(work_dir, exist_ok=True)
 os.makedirs(log_dir, exist_ok=True)
 
+# Lines kept in the log view, and how often it is refreshed.
+LOG_LINES = 5000
+LOG_INTERVAL_MS = 250
+
 class cfg:
     N_HIT_SEQS = 500
     N_TOP_HITS = 350
 
-    N_WORKER = 8
+    N_WORKER = 0  # 0: sized from the host and the sequence (folding/resources.py)
     N_STRUCT = 20
     N_ITER = 100
+    RESUME = False
 
 class ProteinViewer(QMainWindow):
     def __init__(self):
@@ -109,10 +118,24 @@ class ProteinViewer(QMainWindow):
         self.stop_button.setEnabled(False)
         layout.addWidget(self.stop_button)
 
+        # One progress bar per stage, created by its first progress event.
+        self.progress_layout = QFormLayout()
+        self.progress_bars = {}
+        layout.addLayout(self.progress_layout)
+
         self.status_output = QTextEdit()
         self.status_output.setReadOnly(True)
+        self.status_output.document().setMaximumBlockCount(LOG_LINES)
         layout.addWidget(self.status_output)
 
+        # Output is buffered and shown in batches, not line by line.
+        self.pending_lines = []
+        # Incomplete last line of the pipeline output, completed by the next read.
+        self.stdout_tail = b""
+        self.log_timer = QTimer(self)
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start(LOG_INTERVAL_MS)
+
         self.seq_file = None
         self.db_prefix = None
         self.pipeline_proc = None
@@ -152,7 +175,8 @@ class ProteinViewer(QMainWindow):
         main_layout.addWidget(group2)
 
         self.sb_worker = QSpinBox(central_widget)
-        self.sb_worker.setRange(1, 128)
+        self.sb_worker.setRange(0, 128)
+        self.sb_worker.setSpecialValueText("auto")
         self.sb_worker.setValue(cfg.N_WORKER)
         self.sb_worker.valueChanged.connect(
             lambda v: setattr(cfg, "N_WORKER", v)
@@ -175,6 +199,13 @@ class ProteinViewer(QMainWindow):
         )
         group2_layout.addRow("N_ITER:", self.sb_iter)
 
+        self.cb_resume = QCheckBox(central_widget)
+        self.cb_resume.setChecked(cfg.RESUME)
+        self.cb_resume.toggled.connect(
+            lambda v: setattr(cfg, "RESUME", v)
+        )
+        group2_layout.addRow("RESUME:", self.cb_resume)
+
         return main_layout
 
     def pick_file(self):
@@ -248,15 +279,35 @@ class ProteinViewer(QMainWindow):
             self.web_view.setHtml(html)
 
     def log(self, msg):
+        self.pending_lines.append(msg)
+
+    def flush_log(self):
+        if not self.pending_lines:
+            return
+        lines, self.pending_lines = self.pending_lines, []
         if self.log_file:
-            self.log_file.write(msg)
-            self.log_file.write('\n')
+            self.log_file.write("\n".join(lines) + "\n")
             self.log_file.flush()
-        self.status_output.append(msg)
-        QApplication.processEvents()  # update GUI
+        # The view keeps LOG_LINES lines anyway; skip what it would drop.
+        self.status_output.append("\n".join(lines[-LOG_LINES:]))
+
+    def update_progress(self, event):
+        stage = event.get("stage", "?")
+        bar = self.progress_bars.get(stage)
+        if bar is None:
+            bar = self.progress_bars[stage] = QProgressBar()
+            self.progress_layout.addRow(stage, bar)
+        bar.setRange(0, max(int(event.get("total", 0)), 1))
+        bar.setValue(int(event.get("done", 0)))
+        text = "%v/%m"
+        if "best" in event:
+            text += f"  best {event['best']:.1f}"
+        if "eta" in event:
+            text += f"  ETA {int(event['eta']) // 60}:{int(event['eta']) % 60:02d}"
+        bar.setFormat(text)
     
     def run_pipeline_process(self):
-        if self.pipeline_proc and self.pipeline_proc.poll() is None:
+        if self.pipeline_proc and self.pipeline_proc.state() != QProcess.ProcessState.NotRunning:
             return
         if self.seq_file:
             query_file = self.seq_file
@@ -272,18 +323,26 @@ class ProteinViewer(QMainWindow):
             self.log("No database selected!")
             return
 
+        for stage in list(self.progress_bars):
+            self.progress_layout.removeRow(self.progress_bars.pop(stage))
+
         self.pipeline_proc = QProcess(self)
+        self.stdout_tail = b""
         self.pipeline_proc.setProcessChannelMode(QProcess.ProcessChannelMode.MergedChannels)
 
         self.pipeline_proc.readyReadStandardOutput.connect(self.handle_stdout)
         self.pipeline_proc.finished.connect(self.on_pipeline_finished)
 
         # Start the process (replace with your Python command or shell script)
-        cmd = ["python3", "-u", "-c",
-            f"import pipeline; pipeline.run_pipeline('{root_dir}', '{work_dir}', \
-            '{log_dir}', '{query_file}', '{self.db_prefix}', \
-            hit_seqs={cfg.N_HIT_SEQS}, top_hits={cfg.N_TOP_HITS}, \
-            n_worker={cfg.N_WORKER}, n_struct={cfg.N_STRUCT}, n_iter={cfg.N_ITER})"]
+        # The pipeline leads its own process group so stop can signal all stages.
+        cmd = ["python3", "-u", "-m", "pipeline", "run", query_file,
+            "--db_prefix", self.db_prefix, "--work_dir", work_dir,
+            "--hit_seqs", str(cfg.N_HIT_SEQS), "--top_hits", str(cfg.N_TOP_HITS),
+            "--n_workers", str(cfg.N_WORKER or "auto"), "--n_structs", str(cfg.N_STRUCT),
+            "--n_iter", str(cfg.N_ITER),
+            *(["--resume"] if cfg.RESUME else []),
+            "--process_group"]
+        self.pipeline_proc.setWorkingDirectory(root_dir)
 
         self.log(f"Starting pipeline: {' '.join(cmd)}")
         self.pipeline_proc.start(cmd[0], cmd[1:])
@@ -292,20 +351,51 @@ class ProteinViewer(QMainWindow):
         self.stop_button.setEnabled(True)
 
     def handle_stdout(self):
-        data = self.pipeline_proc.readAllStandardOutput().data().decode()
-        for line in data.splitlines():
-            self.log(line)
+        data = self.stdout_tail + self.pipeline_proc.readAllStandardOutput().data()
+        *lines, self.stdout_tail = data.split(b"\n")
+        self.handle_lines(lines)
+
+    def handle_lines(self, lines):
+        events = {}
+        for line in lines:
+            line = line.rstrip(b"\r").decode(errors="replace")
+            event = parse_event(line)
+            if event is None:
+                self.log(line)
+            else:
+                events[event.get("stage")] = event  # only the latest per stage
+        for event in events.values():
+            self.update_progress(event)
+
+    def signal_pipeline(self, proc, sig):
+        try:
+            os.killpg(proc.processId(), sig)
+        except (ProcessLookupError, PermissionError):
+            pass
 
     def stop_pipeline(self):
         if self.pipeline_proc and self.pipeline_proc.state() != QProcess.ProcessState.NotRunning:
-            self.pipeline_proc.kill()  # hard kill
-            self.pipeline_proc = None
-            self.log("Pipeline process killed by user.")
-            self.run_button.setEnabled(True)
+            # SIGTERM every stage; run_builder.py saves its pose pool checkpoint
+            # so the run can be continued with RESUME. Hard kill what is left
+            # after a grace period; on_pipeline_finished re-enables the UI.
+            proc = self.pipeline_proc
+            self.signal_pipeline(proc, signal.SIGTERM)
+            QTimer.singleShot(15000, lambda: self.kill_pipeline(proc))
             self.stop_button.setEnabled(False)
-    
+            self.log("Stopping pipeline...")
+
+    def kill_pipeline(self, proc):
+        if proc.state() != QProcess.ProcessState.NotRunning:
+            self.signal_pipeline(proc, signal.SIGKILL)  # hard kill
+            self.log("Pipeline process killed by user.")
+
     def on_pipeline_finished(self, exitCode, exitStatus):
+        self.handle_stdout()
+        if self.stdout_tail:
+            self.handle_lines([self.stdout_tail])
+            self.stdout_tail = b""
         self.log(f"Pipeline finished with code {exitCode}")
+        self.flush_log()
         self.run_button.setEnabled(True)
         self.stop_button.setEnabled(False)
 
@@ -1,27 +1,29 @@
 from .msa import *
 from .profold import *
+from .scheduler import *
 
 import os
-from Bio import SeqIO
 
-def run_pipeline(root_dir, work_dir, log_dir, query_file, db_prefix, hit_seqs, top_hits, n_worker, n_struct, n_iter):
+def run_pipeline(root_dir, work_dir, log_dir, query_file, db_prefix, hit_seqs, top_hits, n_worker, n_struct, n_iter, checkpoint="new", aln_method="native", rank_hits=None,
+                 in_process=False, precision="fp32"):
+
+    profold._add_path(os.path.join(root_dir, "folding"))
+    from progress import emit
 
     output_prefix = os.path.join(work_dir, "query")
 
+    emit("hhblits", done=0, total=1)
     a3m_file = run_hhblits(log_dir, query_file, db_prefix, output_prefix, maxseq=hit_seqs)
-    records = list(SeqIO.parse(a3m_file, "fasta"))
-
-    # if not top_hits:
-    #     top_hits = len(records)
-    top_hits = min(top_hits, len(records) - 1)
-
-    top_records = records[1:1+top_hits]
-    print(f'Keep {len(top_records)} from {len(records)} sequences.')
-
-    top_a3m_file = a3m_file.replace(".a3m", f"_top{top_hits}.a3m")
-    SeqIO.write(top_records, top_a3m_file, "fasta")
+    emit("hhblits", done=1, total=1)
+    top_a3m_file = select_top_hits(a3m_file, top_hits, rank_by=rank_hits)
 
     aln_file = f"{output_prefix}.aln"
-    a3m_to_aln(log_dir, query_file, top_a3m_file, aln_file)
-
-    profold.run_profold(root_dir, aln_file, n_worker=n_worker, n_struct=n_struct, n_iter=n_iter)
+    a3m_to_aln(log_dir, query_file, top_a3m_file, aln_file, method=aln_method)
+    emit("aln", done=1, total=1)
+
+    if in_process:
+        profold.fold(root_dir, aln_file, os.path.join(root_dir, "predictions"), n_worker=n_worker,
+                     n_struct=n_struct, n_iter=n_iter, checkpoint=checkpoint, precision=precision)
+    else:
+        profold.run_profold(root_dir, aln_file, n_worker=n_worker, n_struct=n_struct, n_iter=n_iter, checkpoint=checkpoint,
+                            precision=precision)
@@ -0,0 +1,125 @@
+"""
+Headless entry point: python -m pipeline {run,fold} ...
+
+Only the standard library and click are imported up front; torch and
+PyRosetta are loaded by the stage that needs them.
+"""
+import os
+import sys
+import click
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Stages that record metrics and can be profiled.
+STAGES = ["inference", "builder", "relax", "rank"]
+# Inference precisions of distance_prediction/run_inference.py.
+PRECISIONS = ["fp32", "bf16", "int8"]
+
+
+def _instrument(output_dir, metrics, profile):
+    """
+    Stages run in child processes too, so metrics are switched on through
+    the environment (see folding/metrics.py).
+    """
+    if metrics or profile:
+        metrics_dir = os.path.abspath(os.path.join(output_dir, "metrics"))
+        os.environ["PROFOLD_METRICS"] = metrics_dir
+        # stage files of an earlier run would be merged into this one
+        for entry in os.listdir(metrics_dir) if os.path.isdir(metrics_dir) else []:
+            if entry.endswith((".json", ".prof")):
+                os.remove(os.path.join(metrics_dir, entry))
+    if profile:
+        os.environ["PROFOLD_PROFILE"] = profile
+
+
+def _checkpoint(resume, keep_checkpoint):
+    """
+    A builder checkpoint is overwritten unless resumed, or kept (the run
+    refuses to start) with --keep_checkpoint.
+    """
+    if resume and keep_checkpoint:
+        raise click.UsageError("--resume and --keep_checkpoint are exclusive")
+    return "resume" if resume else "keep" if keep_checkpoint else "new"
+
+
+@click.group()
+def cli():
+    """
+    ProFOLD pipeline without the GUI.
+    """
+
+
+@cli.command()
+@click.argument("query_file", type=click.Path(exists=True))
+@click.option("-d", "--db_prefix", required=True, type=str)
+@click.option("-w", "--work_dir", default=os.path.join(root_dir, "work_dir"), type=click.Path())
+@click.option("--hit_seqs", default=500, type=int)
+@click.option("--top_hits", default=350, type=int)
+@click.option("--rank_hits", default=None, type=click.Choice(["coverage", "identity"]))
+@click.option("--aln_method", default="native", type=click.Choice(["native", "mafft"]))
+@click.option("-nw", "--n_workers", default="auto", type=str)
+@click.option("-ns", "--n_structs", default=20, type=int)
+@click.option("-ni", "--n_iter", default=100, type=int)
+@click.option("--resume", is_flag=True, default=False)
+@click.option("--keep_checkpoint", is_flag=True, default=False)
+@click.option("--in_process", is_flag=True, default=False)
+@click.option("--precision", default="fp32", type=click.Choice(PRECISIONS))
+@click.option("--metrics", is_flag=True, default=False)
+@click.option("--profile", default=None, type=click.Choice(STAGES))
+# Lead a new process group so the GUI can signal every stage at once.
+@click.option("--process_group", is_flag=True, default=False)
+def run(query_file, db_prefix, work_dir, hit_seqs, top_hits, rank_hits, aln_method,
+        n_workers, n_structs, n_iter, resume, keep_checkpoint, in_process, precision,
+        metrics, profile, process_group):
+    """
+    Search, align and fold a FASTA query.
+    """
+    import pipeline
+
+    if process_group:
+        os.setpgrp()
+    _instrument(os.path.join(root_dir, "predictions"), metrics, profile)
+    log_dir = os.path.join(work_dir, "log")
+    os.makedirs(log_dir, exist_ok=True)
+    pipeline.run_pipeline(
+        root_dir, work_dir, log_dir, os.path.abspath(query_file), db_prefix,
+        hit_seqs, top_hits, n_workers, n_structs, n_iter,
+        checkpoint=_checkpoint(resume, keep_checkpoint), aln_method=aln_method,
+        rank_hits=rank_hits, in_process=in_process, precision=precision,
+    )
+
+
+@cli.command()
+@click.argument("aln_file", type=click.Path(exists=True))
+@click.option("-o", "--output_dir", default=os.path.join(root_dir, "predictions"), type=click.Path())
+@click.option("-nw", "--n_workers", default="auto", type=str)
+@click.option("-ns", "--n_structs", default=20, type=int)
+@click.option("-ni", "--n_iter", default=100, type=int)
+@click.option("--resume", is_flag=True, default=False)
+@click.option("--keep_checkpoint", is_flag=True, default=False)
+@click.option("--in_process", is_flag=True, default=False)
+@click.option("--precision", default="fp32", type=click.Choice(PRECISIONS))
+@click.option("--metrics", is_flag=True, default=False)
+@click.option("--profile", default=None, type=click.Choice(STAGES))
+def fold(aln_file, output_dir, n_workers, n_structs, n_iter, resume, keep_checkpoint,
+         in_process, precision, metrics, profile):
+    """
+    Fold from a ready ALN file, like run_ProFOLD.sh.
+    """
+    from pipeline import profold
+
+    _instrument(output_dir, metrics, profile)
+    checkpoint = _checkpoint(resume, keep_checkpoint)
+    if in_process:
+        profold.fold(root_dir, aln_file, output_dir, n_worker=n_workers, n_struct=n_structs,
+                     n_iter=n_iter, checkpoint=checkpoint, precision=precision)
+    else:
+        profold.run_profold(root_dir, aln_file, n_workers, n_structs, n_iter,
+                            output_dir=output_dir, checkpoint=checkpoint, precision=precision)
+
+
+if __name__ == "__main__":
+    try:
+        cli(prog_name="python -m pipeline")
+    except (RuntimeError, ValueError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
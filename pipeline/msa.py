@@ -1,14 +1,91 @@
 import subprocess
 import os
-from Bio import SeqIO
+import glob
+import json
+import uuid
+import shutil
+import heapq
+import hashlib
 
-def run_hhblits(log_dir, query_file, db_prefix, output_prefix, n_iter=3, e_value=1e-3, maxseq=500):
+# HHblits results are cached by query, database and search parameters.
+# PROFOLD_MSA_CACHE="" disables the cache.
+MSA_CACHE_DIR = os.environ.get(
+    "PROFOLD_MSA_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "profold", "msa")
+)
+MSA_CACHE_SIZE = int(os.environ.get("PROFOLD_MSA_CACHE_SIZE", 10 * 1024 ** 3))
+
+def msa_cache_key(query_file, db_prefix, n_iter, e_value, maxseq):
+    """
+    Hash of the normalized query sequence, the name, size and mtime of every
+    database file and the HHblits parameters that change its output.
+    """
+    with open(query_file) as f:
+        seq = "".join(line.strip() for line in f if not line.startswith(">")).upper()
+    db_files = []
+    for path in sorted(glob.glob(db_prefix + "_*")):
+        st = os.stat(path)
+        db_files.append([os.path.basename(path), st.st_size, int(st.st_mtime)])
+    if not db_files:
+        raise RuntimeError(f"No HHblits database files match {db_prefix}_*")
+    key = json.dumps([seq, db_files, n_iter, float(e_value), maxseq])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def _cache_get(cache_dir, key, a3m_file, hhr_file):
+    entry = os.path.join(cache_dir, key)
+    try:
+        shutil.copyfile(os.path.join(entry, "query.a3m"), a3m_file)
+        shutil.copyfile(os.path.join(entry, "query.hhr"), hhr_file)
+        os.utime(entry)  # most recently used
+    except FileNotFoundError:
+        return False
+    return True
+
+def _cache_put(cache_dir, key, a3m_file, hhr_file, cache_size):
+    """
+    Store a search atomically (concurrent targets may share the cache),
+    then evict the least recently used entries beyond `cache_size` bytes.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_dir = os.path.join(cache_dir, ".tmp-" + uuid.uuid4().hex)
+    os.makedirs(tmp_dir)
+    shutil.copyfile(a3m_file, os.path.join(tmp_dir, "query.a3m"))
+    shutil.copyfile(hhr_file, os.path.join(tmp_dir, "query.hhr"))
+    try:
+        os.rename(tmp_dir, os.path.join(cache_dir, key))
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)  # cached by someone else meanwhile
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, name)
+        if name.startswith(".") or not os.path.isdir(entry):
+            continue
+        try:
+            size = sum(os.path.getsize(os.path.join(entry, x)) for x in os.listdir(entry))
+            entries.append((os.path.getmtime(entry), size, entry))
+        except FileNotFoundError:
+            continue
+    entries.sort(reverse=True)
+    total = 0
+    for _, size, entry in entries:
+        total += size
+        if total > cache_size:
+            shutil.rmtree(entry, ignore_errors=True)
+
+def run_hhblits(log_dir, query_file, db_prefix, output_prefix, n_iter=3, e_value=1e-3, maxseq=500, n_cpu=2,
+                cache_dir=MSA_CACHE_DIR, cache_size=MSA_CACHE_SIZE):
     """
-    Run HHblits with given query and database prefix.
+    Run HHblits with given query and database prefix, unless the same search
+    is in `cache_dir` (None or "" disables the cache).
     """
     a3m_file = f"{output_prefix}.a3m"
     hhr_file = f"{output_prefix}.hhr"
 
+    key = msa_cache_key(query_file, db_prefix, n_iter, e_value, maxseq) if cache_dir else None
+    if key and _cache_get(cache_dir, key, a3m_file, hhr_file):
+        print(f"HHblits cache hit {key[:12]} in {cache_dir}")
+        return a3m_file
+
     cmd = [
         "hhblits",
         "-i", query_file,
@@ -18,6 +95,7 @@ def run_hhblits(log_dir, query_file, db_prefix, output_prefix, n_iter=3, e_value
         "-n", str(n_iter),
         "-e", str(e_value),
         "-maxseq", str(maxseq),
+        "-cpu", str(n_cpu),
     ]
 
     print("Running HHblits:", " ".join(cmd))
@@ -27,18 +105,106 @@ def run_hhblits(log_dir, query_file, db_prefix, output_prefix, n_iter=3, e_value
         ret_code = proc.wait()
     if ret_code != 0:
         raise RuntimeError(f"hhblits failed with exit code {ret_code}. See {log_file} for details.")
+    if key:
+        _cache_put(cache_dir, key, a3m_file, hhr_file, cache_size)
     return a3m_file
 
-def a3m_to_aln(log_dir, query_fasta, a3m_file, aln_file):
+# A3M insertion states: lowercase residues and '.' gaps in insert columns.
+_A3M_INSERTIONS = b"abcdefghijklmnopqrstuvwxyz."
+
+def _read_fasta(path):
     """
-    Convert an A3M file to a ProFOLD-compatible ALN using MAFFT.
-    
-    Parameters:
-        log_dir (str): directory for logs
-        query_fasta (str): query sequence FASTA (gapless)
-        a3m_file (str): A3M file from HHblits
-        aln_file (str): output ALN file (FASTA)
+    Stream (header, sequence) pairs of a FASTA/A3M file as bytes.
+    """
+    header, seq = None, []
+    with open(path, "rb") as f:
+        for line in f:
+            line = line.rstrip()
+            if line.startswith(b">"):
+                if header is not None:
+                    yield header, b"".join(seq)
+                header, seq = line, []
+            elif line:
+                seq.append(line)
+    if header is not None:
+        yield header, b"".join(seq)
+
+def _hit_quality(query, row):
     """
+    (coverage, identity) of an A3M row with its insertions removed:
+    fractions of the query columns that are aligned, and identical. Both
+    are over the query length, so a short identical fragment does not
+    outrank a full-length hit.
+    """
+    aligned = len(row) - row.count(b"-")
+    same = sum(a == b for a, b in zip(query, row))
+    return aligned / max(len(query), 1), same / max(len(query), 1)
+
+def select_top_hits(a3m_file, top_hits, rank_by=None):
+    """
+    Keep `top_hits` hits (the query record excluded) of an A3M file: the
+    first ones in HHblits order, or the best by `rank_by` ("coverage" or
+    "identity" to the query, the other one breaking ties). The A3M is
+    streamed; at most `top_hits` records are held in memory.
+
+    Returns the path of the new A3M file.
+    """
+    records = _read_fasta(a3m_file)
+    query_header, query = next(records)
+    n_records = 1
+    top_records = []
+    if rank_by is not None and rank_by not in ("coverage", "identity"):
+        raise ValueError(f"Unknown hit ranking: {rank_by}")
+    if rank_by is None or top_hits <= 0:
+        for header, seq in records:
+            n_records += 1
+            if len(top_records) < top_hits:
+                top_records.append((header, seq))
+    else:
+        heap = []
+        for header, seq in records:
+            n_records += 1
+            coverage, identity = _hit_quality(query, seq.translate(None, _A3M_INSERTIONS))
+            key = (coverage, identity) if rank_by == "coverage" else (identity, coverage)
+            # -n_records: earlier hits win ties and keep their HHblits order
+            item = (key, -n_records, header, seq)
+            if len(heap) < top_hits:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+        top_records = [(header, seq) for _, _, header, seq in sorted(heap, reverse=True)]
+    print(f'Keep {len(top_records)} from {n_records} sequences.')
+
+    top_a3m_file = a3m_file.replace(".a3m", f"_top{len(top_records)}.a3m")
+    with open(top_a3m_file, "wb") as f:
+        for header, seq in top_records:
+            f.write(header + b"\n" + seq + b"\n")
+    return top_a3m_file
+
+def _a3m_to_aln_native(query_fasta, a3m_file, aln_file):
+    """
+    A3M rows are already aligned to the query: deleting insertion states
+    leaves exactly one character per query column. A row of another length
+    means a malformed A3M and raises ValueError.
+    """
+    query_header, query = next(_read_fasta(query_fasta))
+    query = query.upper()
+    n_hits = 0
+    with open(aln_file, "wb") as out_f:
+        out_f.write(query_header + b"\n" + query + b"\n")
+        for n, (header, seq) in enumerate(_read_fasta(a3m_file), start=1):
+            row = seq.translate(None, _A3M_INSERTIONS)
+            if n == 1 and row == query:
+                continue  # the query record heading a full HHblits A3M
+            if len(row) != len(query):
+                raise ValueError(
+                    f"{a3m_file}: record {n} has {len(row)} match columns, the query {len(query)}"
+                )
+            out_f.write(header + b"\n" + row + b"\n")
+            n_hits += 1
+    return n_hits
+
+def _a3m_to_aln_mafft(log_dir, query_fasta, a3m_file, aln_file):
     log_file = os.path.join(log_dir, "mafft.log")
 
     cmd = [
@@ -56,5 +222,23 @@ def a3m_to_aln(log_dir, query_fasta, a3m_file, aln_file):
     if ret_code != 0:
         raise RuntimeError(f"MAFFT failed with exit code {ret_code}. See {log_file} for details.")
 
-    print(f"Converted {a3m_file} + {query_fasta} -> {aln_file} using MAFFT")
+def a3m_to_aln(log_dir, query_fasta, a3m_file, aln_file, method="native"):
+    """
+    Convert an A3M file to a ProFOLD-compatible ALN.
 
+    Parameters:
+        log_dir (str): directory for logs
+        query_fasta (str): query sequence FASTA (gapless)
+        a3m_file (str): A3M file from HHblits
+        aln_file (str): output ALN file (FASTA)
+        method (str): "native" drops the A3M insertion states,
+            "mafft" realigns the hits with MAFFT --addfragments
+    """
+    if method == "native":
+        n_hits = _a3m_to_aln_native(query_fasta, a3m_file, aln_file)
+        print(f"Converted {a3m_file} + {query_fasta} -> {aln_file} ({n_hits} hits)")
+    elif method == "mafft":
+        _a3m_to_aln_mafft(log_dir, query_fasta, a3m_file, aln_file)
+        print(f"Converted {a3m_file} + {query_fasta} -> {aln_file} using MAFFT")
+    else:
+        raise ValueError(f"Unknown a3m to aln method: {method}")
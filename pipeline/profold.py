@@ -1,31 +1,156 @@
 import os
+import sys
+import time
 import subprocess
 
-def run_profold(root_dir: str, fasta_file: str, n_worker: int, n_struct: int,
-                n_iter: int, output_dir: str = None):
+def _stream(cmd, prefix=""):
     """
-    Run ProFOLD and stream output to both GUI and optionally a log file.
+    Run a command and echo its merged stdout/stderr line by line.
     """
-    profold_script = os.path.join(root_dir, "run_ProFOLD.sh")
-    if not output_dir: output_dir = os.path.join(root_dir, "predictions")
-    os.makedirs(output_dir, exist_ok=True)
-    print(f"Running ProFOLD: {profold_script} {fasta_file} {output_dir}")
-
     process = subprocess.Popen(
-        [profold_script, fasta_file, output_dir, n_worker, n_struct, n_iter],
+        cmd,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
         universal_newlines=True,
         bufsize=1
     )
 
-    # Stream output line by line
     for line in process.stdout:
         line = line.rstrip()
-        print(line)
+        print(prefix + line)
 
     process.stdout.close()
-    return_code = process.wait()
+    return process.wait()
+
+def write_query_fasta(aln_file: str, output_dir: str):
+    """
+    Write the query (first, uppercase) sequence of an ALN file as FASTA,
+    like scripts/first_seq.py does for run_ProFOLD.sh.
+    """
+    target = os.path.splitext(os.path.basename(aln_file))[0]
+    fasta_file = os.path.join(output_dir, f"{target}.fasta")
+    seq = []
+    with open(aln_file) as f:
+        f.readline()
+        for line in f:
+            if line.startswith(">"):
+                break
+            seq.append("".join(c for c in line.strip() if c.isupper()))
+    with open(fasta_file, "w") as f:
+        f.write(f">{target}\n{''.join(seq)}\n")
+    return fasta_file
+
+def predict_distance(root_dir: str, aln_file: str, feat_file: str,
+                     n_thread: int = 0, prefix: str = "", precision: str = "fp32"):
+    """
+    Stage 1 of run_ProFOLD.sh: predict distograms with the TorchScript models.
+    """
+    script = os.path.join(root_dir, "distance_prediction", "run_inference.py")
+    cmd = [
+        sys.executable, script,
+        "-m", os.path.join(root_dir, "distance_prediction", "model"),
+        "-i", aln_file,
+        "-o", feat_file,
+        "--n_threads", str(n_thread),
+        "--precision", precision,
+    ]
+    if _stream(cmd, prefix) != 0 or not os.path.exists(feat_file):
+        raise RuntimeError(f"Predict distance failed for {aln_file}.")
+    return feat_file
+
+def build_structures(root_dir: str, fasta_file: str, feat_file: str, output_dir: str,
+                     n_worker: int, n_struct: int, n_iter: int, prefix: str = "",
+                     checkpoint: str = "new"):
+    """
+    Stage 2 of run_ProFOLD.sh: generate centroid decoys by gradient descent.
+    `checkpoint` is "new" (overwrite), "resume" or "keep", as in run_ProFOLD.sh.
+    """
+    script = os.path.join(root_dir, "folding", "run_builder.py")
+    cmd = [
+        sys.executable, script,
+        "-i", fasta_file,
+        "-f", feat_file,
+        "-o", output_dir,
+        "--n_workers", str(n_worker),
+        "--n_structs", str(n_struct),
+        "--n_iter", str(n_iter),
+    ]
+    if checkpoint == "resume":
+        cmd.append("--resume")
+    elif checkpoint == "keep":
+        cmd.append("--keep_checkpoint")
+    if _stream(cmd, prefix) != 0:
+        raise RuntimeError(f"Structure generation failed for {fasta_file}.")
+    return os.path.join(output_dir, "final")
+
+def relax_structures(root_dir: str, fasta_file: str, feat_file: str, input_dir: str,
+                     output_dir: str, n_worker: int, prefix: str = ""):
+    """
+    Stage 3 of run_ProFOLD.sh: full-atom relax of every decoy in `input_dir`.
+    """
+    script = os.path.join(root_dir, "folding", "run_relax.py")
+    cmd = [
+        sys.executable, script,
+        "-s", fasta_file,
+        "-f", feat_file,
+        "-i", input_dir,
+        "-o", output_dir,
+        "--n_workers", str(n_worker),
+    ]
+    if _stream(cmd, prefix) != 0:
+        raise RuntimeError(f"Full-atom relax failed for {fasta_file}.")
+    return output_dir
+
+def rank_decoys(relax_dir: str, rank_file: str):
+    """
+    Stage 4 of run_ProFOLD.sh: sort relaxed decoys by the total score found
+    on their "pose" line.
+    """
+    ranking = []
+    for root, _, files in os.walk(relax_dir):
+        for name in files:
+            if not name.endswith(".pdb"):
+                continue
+            path = os.path.join(root, name)
+            score = ""
+            with open(path) as f:
+                for line in f:
+                    if line.startswith("pose"):
+                        score = line.split()[-1]
+            ranking.append((path, score))
+
+    def _key(item):
+        try:
+            return float(item[1])
+        except ValueError:
+            return 0.0
+
+    ranking.sort(key=_key)
+    with open(rank_file, "w") as f:
+        for path, score in ranking:
+            f.write(f"{path} {score}\n")
+    return rank_file
+
+def run_profold(root_dir: str, fasta_file: str, n_worker: int, n_struct: int,
+                n_iter: int, output_dir: str = None, decoy_format: str = "pdb",
+                checkpoint: str = "new", precision: str = "fp32"):
+    """
+    Run ProFOLD and stream output to both GUI and optionally a log file.
+
+    `checkpoint` is "resume" to continue an interrupted run from its pose
+    pool checkpoint, "new" to overwrite it, or "keep" to refuse to run
+    when there is one. `precision` is that
+    of the inference models (see run_inference.py).
+    """
+    profold_script = os.path.join(root_dir, "run_ProFOLD.sh")
+    if not output_dir: output_dir = os.path.join(root_dir, "predictions")
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Running ProFOLD: {profold_script} {fasta_file} {output_dir}")
+
+    return_code = _stream(
+        [profold_script, fasta_file, output_dir, str(n_worker), str(n_struct), str(n_iter),
+         decoy_format, checkpoint, precision]
+    )
 
     if return_code != 0:
         print(f"ProFOLD failed. Return code: {return_code}")
@@ -35,3 +160,98 @@ def run_profold(root_dir: str, fasta_file: str, n_worker: int, n_struct: int,
 
     return output_dir
 
+PYROSETTA_FLAGS = "-hb_cen_soft -relax:default_repeats 5 -default_max_cycles 200 -out:level 100"
+
+def _add_path(path):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+def fold(root_dir: str, aln_file: str, output_dir: str, n_worker="auto",
+         n_struct: int = 20, n_iter: int = 100, n_thread="auto",
+         checkpoint: str = "new", n_seeds: int = 0, constraint_budget: float = None,
+         precision: str = "fp32"):
+    """
+    Run every stage of run_ProFOLD.sh in this process: torch, the models and
+    PyRosetta are loaded once, features and decoys are passed between stages
+    in memory, and only the relax stage forks workers. Writes the same
+    outputs (<target>.npz, relax/*.pdb, rank.txt).
+
+    `n_worker` and `n_thread` may be "auto" to size each stage from the
+    host and the sequence length (see folding/resources.py).
+
+    Returns (rank file, {stage: seconds}).
+    """
+    timings = {}
+    t = time.time()
+    _add_path(os.path.join(root_dir, "distance_prediction"))
+    _add_path(os.path.join(root_dir, "folding"))
+    from validate import check_aln
+
+    check_aln(aln_file)  # before spending time on imports and models
+    import numpy as np
+    import torch
+    import pyrosetta
+    import run_inference
+    import metrics
+    from resources import workers
+    from run_builder import build
+    from run_relax import relax_poses
+
+    pyrosetta.init(PYROSETTA_FLAGS)
+    if metrics.enabled():
+        metrics.clear(os.environ["PROFOLD_METRICS"])
+    timings["startup"] = time.time() - t
+
+    os.makedirs(output_dir, exist_ok=True)
+    fasta_file = write_query_fasta(aln_file, output_dir)
+    target = os.path.splitext(os.path.basename(fasta_file))[0]
+    with open(fasta_file) as f:
+        seq = f.readlines()[1].strip()
+    if checkpoint == "keep" and os.path.exists(os.path.join(output_dir, "checkpoint.npz")):
+        raise RuntimeError(
+            f"{output_dir} has a builder checkpoint: fold with checkpoint='resume' or 'new'"
+        )
+
+    t = time.time()
+    feat_file = os.path.join(output_dir, f"{target}.npz")
+    with metrics.stage("inference"):
+        if (checkpoint == "resume" and os.path.exists(feat_file)
+                and run_inference.feature_precision(feat_file) == precision):
+            print(f"Reuse {feat_file}")
+            feature = run_inference.load_feature(feat_file)
+        else:
+            n_thread = workers(n_thread, "inference", len(seq))
+            if n_thread > 0:
+                torch.set_num_threads(n_thread)
+            models = run_inference.load_models(
+                os.path.join(root_dir, "distance_prediction", "model"), precision
+            )
+            feature = run_inference.predict(models, aln_file)
+            run_inference.save_feature(feat_file, feature, precision)
+    timings["inference"] = time.time() - t
+
+    t = time.time()
+    with metrics.stage("builder"):
+        poses, _ = build(seq, feature, output_dir, workers(n_worker, "builder", len(seq)),
+                         n_struct, n_iter,
+                         resume=checkpoint == "resume", n_seeds=n_seeds,
+                         constraint_budget=constraint_budget)
+    timings["builder"] = time.time() - t
+
+    t = time.time()
+    relax_dir = os.path.join(output_dir, "relax")
+    os.makedirs(relax_dir, exist_ok=True)
+    output_paths = [os.path.join(relax_dir, "%s_%02i.pdb" % (target, i)) for i in range(len(poses))]
+    with metrics.stage("relax"):
+        n_relax = workers(n_worker, "relax", len(seq), n_structs=len(poses))
+        ranking = relax_poses(seq, feature, poses, output_paths, n_relax)
+    timings["relax"] = time.time() - t
+
+    rank_file = os.path.join(output_dir, "rank.txt")
+    with open(rank_file, "w") as f:
+        for path, score in sorted(ranking, key=lambda x: x[1]):
+            f.write(f"{path} {score}\n")
+    if metrics.enabled():
+        metrics.merge(os.environ["PROFOLD_METRICS"], os.path.join(output_dir, "metrics.json"))
+    print("Stage times: " + ", ".join(f"{k} {v:.1f}s" for k, v in timings.items()))
+    return rank_file, timings
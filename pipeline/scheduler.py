@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import threading
+
+from . import msa, profold
+
+__all__ = ["Scheduler", "Target", "run_campaign"]
+
+# Stages of one target, in order. Targets given as an ALN start at "inference".
+STAGES = ["hhblits", "aln", "inference", "builder", "relax", "rank"]
+
+PENDING, RUNNING, DONE, FAILED, SKIPPED = "pending", "running", "done", "failed", "skipped"
+
+
+class Target:
+    """
+    One structure prediction job of a campaign.
+
+    `query_file` is either a single-sequence FASTA (the MSA is searched with
+    HHblits) or a ready-made ALN file (the MSA stages are skipped).
+    """
+
+    def __init__(self, query_file, name=None):
+        self.query_file = os.path.abspath(query_file)
+        self.name = name or os.path.splitext(os.path.basename(query_file))[0]
+        self.from_aln = query_file.endswith(".aln")
+        self.states = {
+            stage: SKIPPED if self.from_aln and stage in ("hhblits", "aln") else PENDING
+            for stage in STAGES
+        }
+        self.times = {}
+        self.cpus = {}
+        self.error = None
+        self.files = {}
+        self.waiting_since = time.time()
+
+    def next_stage(self):
+        """
+        First stage that is not finished, or None if the target is complete.
+        """
+        for stage in STAGES:
+            state = self.states[stage]
+            if state in (PENDING, RUNNING, FAILED):
+                return stage
+        return None
+
+    def ready_stage(self):
+        stage = self.next_stage()
+        if stage is not None and self.states[stage] == PENDING:
+            return stage
+        return None
+
+    def status(self):
+        return {
+            "query_file": self.query_file,
+            "stage": self.next_stage(),
+            "error": self.error,
+            "stages": {
+                stage: dict(state=self.states[stage], cpus=self.cpus.get(stage),
+                            **self.times.get(stage, {}))
+                for stage in STAGES
+            },
+        }
+
+
+class Scheduler:
+    """
+    Run the stages of several targets concurrently under a global CPU budget.
+
+    Stages of one target run in order, but stages of different targets
+    overlap, e.g. inference of one target while another one is minimizing.
+    Targets further along the pipeline are served first so finished models
+    come out steadily; smaller stages of other targets fill the idle cores.
+    A stage that has waited longer than `max_wait` seconds goes first, and
+    no other stage is started until enough cores are free for it.
+    """
+
+    def __init__(self, root_dir, work_dir, db_prefix=None, cpu_budget=None,
+                 status_file=None, hit_seqs=500, top_hits=350, n_worker=8,
+                 n_struct=20, n_iter=100, hhblits_cpu=2, inference_threads=4,
+                 max_wait=600, aln_method="native", msa_cache=msa.MSA_CACHE_DIR,
+                 rank_hits=None):
+        self.root_dir = root_dir
+        self.work_dir = os.path.abspath(work_dir)
+        self.db_prefix = db_prefix
+        self.cpu_budget = cpu_budget or os.cpu_count() or 1
+        self.status_file = status_file or os.path.join(self.work_dir, "status.json")
+        self.hit_seqs = hit_seqs
+        self.top_hits = top_hits
+        self.n_worker = n_worker
+        self.n_struct = n_struct
+        self.n_iter = n_iter
+        self.max_wait = max_wait
+        self.aln_method = aln_method
+        self.msa_cache = msa_cache
+        self.rank_hits = rank_hits
+        self.stage_cpus = {
+            "hhblits": hhblits_cpu,
+            "aln": 1,
+            "inference": inference_threads,
+            "builder": n_worker,
+            "relax": n_worker,
+            "rank": 1,
+        }
+
+        self.targets = []
+        self._cpu_used = 0
+        self._cond = threading.Condition()
+        self._started = time.time()
+
+    def add(self, query_file, name=None):
+        target = Target(query_file, name)
+        if any(t.name == target.name for t in self.targets):
+            raise ValueError(f"Duplicate target name: {target.name}")
+        if not target.from_aln and not self.db_prefix:
+            raise ValueError(f"{target.name}: a database prefix is required for FASTA input.")
+        self.targets.append(target)
+        return target
+
+    def _cost(self, stage):
+        return max(1, min(self.stage_cpus[stage], self.cpu_budget))
+
+    def _pick(self):
+        """
+        Pick the next (target, stage) that fits in the free CPU budget.
+        """
+        free = self.cpu_budget - self._cpu_used
+        ready = [(t, t.ready_stage()) for t in self.targets]
+        ready = [(t, s) for t, s in ready if s is not None]
+        now = time.time()
+        starved = [(t, s) for t, s in ready if now - t.waiting_since > self.max_wait]
+        if starved:
+            target, stage = min(starved, key=lambda x: x[0].waiting_since)
+            # Hold the freed cores back for the starved stage.
+            return (target, stage) if self._cost(stage) <= free else None
+        # Most advanced targets first, then submission order.
+        ready.sort(key=lambda x: -STAGES.index(x[1]))
+        for target, stage in ready:
+            if self._cost(stage) <= free:
+                return target, stage
+        return None
+
+    def _pending(self):
+        return any(t.next_stage() is not None and t.error is None for t in self.targets)
+
+    def write_status(self):
+        status = {
+            "cpu_budget": self.cpu_budget,
+            "cpu_used": self._cpu_used,
+            "elapsed": round(time.time() - self._started, 1),
+            "targets": {t.name: t.status() for t in self.targets},
+        }
+        tmp_file = self.status_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(status, f, indent=2)
+        os.replace(tmp_file, self.status_file)
+
+    def run(self):
+        os.makedirs(self.work_dir, exist_ok=True)
+        threads = []
+        with self._cond:
+            self.write_status()
+            while self._pending():
+                picked = self._pick()
+                if picked is None:
+                    self._cond.wait(timeout=10)
+                    continue
+                target, stage = picked
+                cost = self._cost(stage)
+                self._cpu_used += cost
+                target.states[stage] = RUNNING
+                target.cpus[stage] = cost
+                target.times[stage] = {"start": round(time.time() - self._started, 1)}
+                self.write_status()
+                thread = threading.Thread(target=self._run_stage, args=(target, stage, cost))
+                thread.start()
+                threads.append(thread)
+            self.write_status()
+        for thread in threads:
+            thread.join()
+        return {t.name: t.error is None for t in self.targets}
+
+    def _run_stage(self, target, stage, cost):
+        print(f"[{target.name}] Start {stage} with {cost} cpu(s)")
+        try:
+            getattr(self, f"_stage_{stage}")(target, cost)
+            state = DONE
+        except Exception as e:
+            target.error = f"{stage}: {e}"
+            state = FAILED
+        print(f"[{target.name}] {stage} {state}")
+        with self._cond:
+            self._cpu_used -= cost
+            target.states[stage] = state
+            target.waiting_since = time.time()
+            target.times[stage]["end"] = round(time.time() - self._started, 1)
+            self.write_status()
+            self._cond.notify_all()
+
+    def _target_dirs(self, target):
+        target_dir = os.path.join(self.work_dir, target.name)
+        log_dir = os.path.join(target_dir, "log")
+        output_dir = os.path.join(target_dir, "predictions")
+        for path in (target_dir, log_dir, output_dir):
+            os.makedirs(path, exist_ok=True)
+        return target_dir, log_dir, output_dir
+
+    def _stage_hhblits(self, target, cost):
+        target_dir, log_dir, _ = self._target_dirs(target)
+        target.files["a3m"] = msa.run_hhblits(
+            log_dir, target.query_file, self.db_prefix,
+            os.path.join(target_dir, target.name), maxseq=self.hit_seqs, n_cpu=cost,
+            cache_dir=self.msa_cache,
+        )
+
+    def _stage_aln(self, target, cost):
+        target_dir, log_dir, _ = self._target_dirs(target)
+        top_a3m_file = msa.select_top_hits(target.files["a3m"], self.top_hits, self.rank_hits)
+        aln_file = os.path.join(target_dir, f"{target.name}.aln")
+        msa.a3m_to_aln(log_dir, target.query_file, top_a3m_file, aln_file,
+                       method=self.aln_method)
+        target.files["aln"] = aln_file
+
+    def _stage_inference(self, target, cost):
+        _, _, output_dir = self._target_dirs(target)
+        aln_file = target.query_file if target.from_aln else target.files["aln"]
+        target.files["fasta"] = profold.write_query_fasta(aln_file, output_dir)
+        feat_file = os.path.join(output_dir, f"{target.name}.npz")
+        target.files["feat"] = profold.predict_distance(
+            self.root_dir, aln_file, feat_file, n_thread=cost, prefix=f"[{target.name}] ",
+        )
+
+    def _stage_builder(self, target, cost):
+        _, _, output_dir = self._target_dirs(target)
+        target.files["final"] = profold.build_structures(
+            self.root_dir, target.files["fasta"], target.files["feat"], output_dir,
+            n_worker=cost, n_struct=self.n_struct, n_iter=self.n_iter,
+            prefix=f"[{target.name}] ",
+        )
+
+    def _stage_relax(self, target, cost):
+        _, _, output_dir = self._target_dirs(target)
+        target.files["relax"] = profold.relax_structures(
+            self.root_dir, target.files["fasta"], target.files["feat"],
+            target.files["final"], os.path.join(output_dir, "relax"),
+            n_worker=cost, prefix=f"[{target.name}] ",
+        )
+
+    def _stage_rank(self, target, cost):
+        _, _, output_dir = self._target_dirs(target)
+        target.files["rank"] = profold.rank_decoys(
+            target.files["relax"], os.path.join(output_dir, "rank.txt"),
+        )
+
+
+def run_campaign(root_dir, work_dir, query_files, db_prefix=None, cpu_budget=None,
+                 status_file=None, **kwargs):
+    """
+    Fold every query in `query_files` with a shared Scheduler.
+
+    Returns a dict mapping each target name to True on success.
+    """
+    scheduler = Scheduler(root_dir, work_dir, db_prefix=db_prefix, cpu_budget=cpu_budget,
+                          status_file=status_file, **kwargs)
+    for query_file in query_files:
+        scheduler.add(query_file)
+    return scheduler.run()
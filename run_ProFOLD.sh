@@ -12,45 +12,80 @@ _filename=$(basename -- "$aln")
 target="${_filename%.*}"
 fasta=$outdir/$target.fasta
 
-n_workers=${3:-8}
+n_workers=${3:-auto}  # a count, or auto (folding/resources.py)
 n_structs=${4:-20}
 n_iter=${5:-100}
+decoy_format=${6:-pdb}  # pdb | container
+checkpoint=${7:-new}    # new (overwrites a checkpoint) | resume | keep (refuses to)
+precision=${8:-fp32}    # fp32 | bf16 | int8 inference
 
 mkdir -p "$outdir"
+if [ -n "$PROFOLD_METRICS" ]; then
+    # stage files of an earlier run would be merged into this one
+    rm -f "$PROFOLD_METRICS"/*.json "$PROFOLD_METRICS"/*.prof
+fi
 
 echo ">$target" > "$fasta"
 # head -1 $aln >> $fasta
 python3 "$BINROOT/scripts/first_seq.py" "$aln" >> "$fasta"
 
+feat=$outdir/$target.npz
 echo "Predict distance--------------------------------------------------------"
+inference_opts=()
+# a feature file is reused only if predicted in the same precision
+[ "$checkpoint" = "resume" ] && inference_opts+=(--resume)
 "$BINROOT/distance_prediction/run_inference.py" \
     -m "$BINROOT/distance_prediction/model" \
     -i "$aln" \
-    -o "$outdir/$target.npz"
-feat=$outdir/$target.npz
+    -o "$feat" \
+    --precision "$precision" \
+    "${inference_opts[@]}"
 if [ ! -e "$feat" ]; then
     echo "Predict distance failed... Stop"
     exit 1
 fi
 
 echo "Generate structure by gradient descent----------------------------------"
+if [ "$decoy_format" = "container" ]; then
+    builder_out=(--decoy_file "$outdir/$target.decoys")
+    relax_in=$outdir/$target.decoys
+else
+    builder_out=()
+    relax_in=$outdir/final
+fi
+case "$checkpoint" in
+    resume) builder_out+=(--resume) ;;
+    keep) builder_out+=(--keep_checkpoint) ;;
+esac
 "$BINROOT/folding/run_builder.py" \
     -i "$fasta" \
     -f "$feat" \
     -o "$outdir" \
     --n_workers $n_workers \
     --n_structs $n_structs \
-    --n_iter $n_iter
+    --n_iter $n_iter \
+    "${builder_out[@]}" || exit $?
 
 echo "Full-atom relax---------------------------------------------------------"
 "$BINROOT/folding/run_relax.py" \
     -s "$fasta" \
     -f "$feat" \
-    -i "$outdir/final" \
+    -i "$relax_in" \
     -o "$outdir/relax" \
     --n_workers $n_workers
 
 echo "Ranking decoy-----------------------------------------------------------"
-find "$outdir/relax" -name '*.pdb' | while read -r LINE; do
-    echo "$LINE" "$(grep "^pose" "$LINE" | awk '{print $NF}')"
-done | sort -k 2 -n > "$outdir/rank.txt"
+if [ "$decoy_format" = "container" ]; then
+    "$BINROOT/folding/run_rank.py" \
+        -i "$outdir/relax/$target.decoys" \
+        -o "$outdir/rank.txt" \
+        -e "$outdir/relax"
+else
+    find "$outdir/relax" -name '*.pdb' | while read -r LINE; do
+        echo "$LINE" "$(grep "^pose" "$LINE" | awk '{print $NF}')"
+    done | sort -k 2 -n > "$outdir/rank.txt"
+fi
+# Stage metrics, if enabled with PROFOLD_METRICS=<dir>
+if [ -n "$PROFOLD_METRICS" ]; then
+    python3 "$BINROOT/folding/metrics.py" "$PROFOLD_METRICS" "$outdir/metrics.json"
+fi
@@ -1,32 +1,17 @@
 #!/usr/bin/env python3
+import os
 import sys
 
-from Bio import SeqIO
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "folding"))
+from validate import check_aln
 
 def validate_aln(aln_path):
-    seqs = [str(record.seq).upper() for record in SeqIO.parse(aln_path, "fasta")]
-    AMINO = "ACDEFGHIKLMNPQRSTVWY-XBZUOJ"
-
-    if len(seqs) < 2:
-        print("Error: less than 2 sequences in the ALN file.")
-        return False
-
-    lengths = [len(seq) for seq in seqs]
-    if len(set(lengths)) > 1:
-        print("Error: sequences have different lengths!")
+    try:
+        n_seqs, length, n_distinct = check_aln(aln_path)
+    except ValueError as e:
+        print(f"Error: {e}")
         return False
-
-    for i, seq in enumerate(seqs, 1):
-        for aa in seq:
-            if aa not in AMINO:
-                print(f"Invalid character '{aa}' on {i}-th sequence")
-                return False
-
-    unique_seqs = set(seqs)
-    if len(unique_seqs) < 2:
-        print(f"Warning: too few unique sequences: {len(unique_seqs)}")
-
-    print("ALN file looks OK")
+    print(f"ALN file looks OK: {n_seqs} sequences of length {length}, {n_distinct} distinct")
     return True
 
 def main():
@@ -35,8 +20,7 @@ def main():
         sys.exit(1)
 
     aln_path = sys.argv[1]
-    validate_aln(aln_path)
+    sys.exit(0 if validate_aln(aln_path) else 1)
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import tempfile
+from multiprocessing import Process
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "folding"))
+from fsqueue import TaskQueue, serve
+
+LEASE = 1.0
+
+
+def _square(task):
+    if task.get("crash") and not os.path.exists(task["crash"]):
+        open(task["crash"], "w").close()
+        os._exit(1)  # die while holding the claim
+    time.sleep(0.01)
+    return {"y": task["x"] ** 2, "pid": os.getpid()}
+
+
+def _worker(queue_dir, run):
+    serve(TaskQueue(queue_dir), _square, LEASE, poll=0.05, run=run)
+
+
+def main():
+    """
+    Run two coordinators on one temp queue directory with several local
+    worker processes, one of which dies mid-task, and check that every task
+    of each run is answered exactly once, to its own run.
+    """
+    n_tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    n_workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    queue_dir = tempfile.mkdtemp(prefix="fsqueue_")
+    runs = [TaskQueue(queue_dir), TaskQueue(queue_dir)]
+    crash = os.path.join(queue_dir, "crashed")
+    for k, task_queue in enumerate(runs):
+        for i in range(n_tasks):
+            task = {"x": i + 1000 * k}
+            if k == 0 and i == n_tasks // 2:
+                task["crash"] = crash
+            task_queue.publish("t%05i" % i, task)
+
+    procs = [
+        Process(target=_worker, args=(queue_dir, runs[i % 2].run)) for i in range(n_workers)
+    ]
+    procs.append(Process(target=_worker, args=(queue_dir, runs[0].run)))  # replacement
+    for proc in procs:
+        proc.start()
+
+    start = time.time()
+    ok = True
+    for k, task_queue in enumerate(runs):
+        results = dict(task_queue.drain(["t%05i" % i for i in range(n_tasks)], LEASE, poll=0.05))
+        good = all(results["t%05i" % i]["y"] == (i + 1000 * k) ** 2 for i in range(n_tasks))
+        print("run %s: %i results, correct: %s" % (task_queue.run, len(results), good))
+        ok = ok and good and len(results) == n_tasks
+        task_queue.stop()
+    for proc in procs:
+        proc.join(timeout=10)
+        ok = ok and proc.exitcode is not None
+    print("crashed worker requeued: %s" % os.path.exists(crash))
+    print("elapsed %.2fs" % (time.time() - start))
+    print("fsqueue OK" if ok else "fsqueue FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Check that `python -m pipeline` starts fast: importing the pipeline package
+must not pull in the GUI, torch or PyRosetta, and stay within a time budget.
+"""
+import os
+import sys
+import subprocess
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("PyQt6", "qdarkstyle", "py3Dmol", "torch", "pyrosetta", "numpy", "Bio")
+BUDGET_MS = 300
+
+
+def import_times(module):
+    """
+    Returns {module: cumulative microseconds} from `python -X importtime`.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        cwd=root_dir, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    ok = True
+    for module in ("pipeline", "pipeline.__main__"):
+        times = import_times(module)
+        heavy = sorted(name for name in times if name.split(".")[0] in HEAVY)
+        if heavy:
+            print(f"{module} imports {', '.join(heavy)}")
+            ok = False
+        ms = times[module] / 1000
+        print(f"import {module}: {ms:.1f} ms")
+        if ms > BUDGET_MS:
+            print(f"{module} takes longer than {BUDGET_MS} ms to import")
+            ok = False
+    if not ok:
+        sys.exit(1)
+    print("import time OK")
+
+
+if __name__ == "__main__":
+    main()
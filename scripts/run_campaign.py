@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+import os
+import sys
+import click
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_dir)
+import pipeline
+
+
+@click.command()
+@click.argument("query_files", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option("-w", "--work_dir", required=True, type=click.Path())
+@click.option("-d", "--db_prefix", default=None, type=str)
+@click.option("-c", "--cpu_budget", default=None, type=int)
+@click.option("-s", "--status_file", default=None, type=click.Path())
+@click.option("--hit_seqs", default=500, type=int)
+@click.option("--top_hits", default=350, type=int)
+@click.option("--rank_hits", default=None, type=click.Choice(["coverage", "identity"]))
+@click.option("--msa_cache", default=pipeline.MSA_CACHE_DIR, type=str)
+@click.option("--aln_method", default="native", type=click.Choice(["native", "mafft"]))
+@click.option("-nw", "--n_workers", default=8, type=int)
+@click.option("-ns", "--n_structs", default=20, type=int)
+@click.option("-ni", "--n_iter", default=100, type=int)
+def main(query_files, work_dir, db_prefix, cpu_budget, status_file, hit_seqs, top_hits,
+         rank_hits, msa_cache, aln_method, n_workers, n_structs, n_iter):
+    """
+    Fold a queue of targets (*.fasta searched with HHblits, or ready *.aln),
+    overlapping the stages of different targets under one CPU budget.
+    """
+    results = pipeline.run_campaign(
+        root_dir, work_dir, query_files, db_prefix=db_prefix, cpu_budget=cpu_budget,
+        status_file=status_file, hit_seqs=hit_seqs, top_hits=top_hits, aln_method=aln_method,
+        msa_cache=msa_cache, rank_hits=rank_hits,
+        n_worker=n_workers, n_struct=n_structs, n_iter=n_iter,
+    )
+    failed = [name for name, ok in results.items() if not ok]
+    if failed:
+        print("Failed targets:", " ".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()